@@ -1,15 +1,16 @@
 """Simplified Map Cog for Discord Bot — CV2 edition."""
 
 import asyncio
-import math
+import hashlib
 import time
-import geopandas as gpd
 from pathlib import Path
-from typing import Optional, Dict, Tuple, List
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Tuple, List, Set
+from datetime import datetime
 from copy import deepcopy
+from itertools import islice
 from PIL import Image as PILImage
 from io import BytesIO
+import numpy as np
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
@@ -26,13 +27,33 @@ APOLOGY_TEXT = (
 DEV_GUILD = 1398409754967015647
 # Apology expiry: set to time.time() + 86400 on first load, survives restarts
 _APOLOGY_EXPIRY: float = 0.0
-from core.map_gen import MapGenerator
+# Radius for the "other pins nearby" line on the Your Pin card
+NEARBY_RADIUS_KM = 50.0
+# Seconds settings changes are collected before they are written, see _save_data()
+SAVE_DELAY = 2.0
+# Geocoder results kept in memory, see _geocode()
+GEOCODE_CACHE_SIZE = 1024
+# Seconds an edit of the posted map card may take, rate-limit waits included
+MAP_EDIT_TIMEOUT = 30.0
+from core.cache_manager import LRUCache
+from core.map_gen import MapGenerator, encode_map_image, optimize_png, run_encode
 from core.map_storage import MapStorage
 from core.map_views import LocationModal, UserPinOptionsView, UpdateLocationModal
 from core.config import config as bot_config
 from core.map_config import MapConfig
 
-from core.timezone_util import get_german_time, format_german_time
+
+def _pin_time(ts, style: str = "F") -> str:
+    """Render a pin timestamp as a Discord timestamp tag (``style`` F = full date, R = relative).
+
+    Pins store epoch seconds; strings written by older versions are still accepted.
+    """
+    if isinstance(ts, (int, float)):
+        return f"<t:{int(ts)}:{style}>"
+    try:
+        return f"<t:{int(datetime.fromisoformat(ts).timestamp())}:{style}>"
+    except (TypeError, ValueError):
+        return ts or "Unknown"
 
 
 class MapV2Cog(commands.Cog):
@@ -48,6 +69,24 @@ class MapV2Cog(commands.Cog):
         self.maps: Dict = {}
         self._guild_names: dict = {}
         self._snapshots: dict = {}
+        self._pending_updates: Dict[int, asyncio.Task] = {}
+        self._pending_since: Dict[int, float] = {}
+        self._update_locks: Dict[int, asyncio.Lock] = {}
+        # Signature of what each guild's map card currently shows, see _map_signature()
+        self._map_sigs: Dict[int, str] = {}
+        # Columnar mirror of each guild's pins, see _pins_soa()
+        self._pin_arrays: Dict[str, Dict[str, np.ndarray]] = {}
+        # Renders run in worker threads; cap how many full-size canvases exist at once
+        self._render_semaphore = asyncio.Semaphore(2)
+        # Guilds whose settings row awaits the next coalesced write, see _save_data()
+        self._dirty_guilds: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Geocoder results by normalized query, and lookups currently in flight
+        self._geocode_cache = LRUCache(GEOCODE_CACHE_SIZE)
+        self._geocode_inflight: Dict[str, asyncio.Task] = {}
+        # geocode_cache failures are logged as a warning once, then at debug level
+        self._geocode_db_warned = False
+
     def _snapshot_settings(self, guild_id: str):
         """Store a snapshot of current settings for potential revert."""
         md = self.maps.get(guild_id, {})
@@ -61,7 +100,7 @@ class MapV2Cog(commands.Cog):
 
     # ── CV2 builders ──────────────────────────────────────────────────
 
-    def _build_map_card_view(self, guild_id: int) -> discord.ui.LayoutView:
+    def _build_map_card_view(self, guild_id: int, image_name: str = "map.png") -> discord.ui.LayoutView:
         map_data = self.maps.get(str(guild_id), {})
         region = map_data.get("region", "world")
         pin_count = len(map_data.get("pins", {}))
@@ -82,7 +121,7 @@ class MapV2Cog(commands.Cog):
         title = f"## {server_name} — Map\n-# {pin_count} Pins · {region.capitalize()} · Last changed: <t:{int(time.time())}:R>"
         container.add_item(discord.ui.TextDisplay(title))
         gallery = discord.ui.MediaGallery()
-        gallery.add_item(media="attachment://map.png")
+        gallery.add_item(media=f"attachment://{image_name}")
         container.add_item(gallery)
         container.add_item(discord.ui.TextDisplay("-# Customise via `/map` (admin only)"))
         container.add_item(discord.ui.Separator())
@@ -218,15 +257,14 @@ class MapV2Cog(commands.Cog):
         try:
             if guild_id in self.maps and user_id in self.maps[guild_id].get('pins', {}):
                 up = self.maps[guild_id]['pins'][user_id]
-                ts = up.get('timestamp', '')
-                try:
-                    ts_fmt = f"<t:{int(datetime.fromisoformat(ts).timestamp())}:F>"
-                except Exception:
-                    ts_fmt = ts or "Unknown"
+                text = f"## 📍 Your Pin\n**Location:** {up.get('display_name', 'Unknown')}\n**Added:** {_pin_time(up.get('timestamp'))}"
+                if self.maps[guild_id].get('allow_proximity', True):
+                    nearby = self._nearby_pin_count(guild_id, user_id)
+                    if nearby:
+                        text += f"\n-# {nearby} other pin{'s' if nearby != 1 else ''} within {NEARBY_RADIUS_KM:g} km"
                 view = discord.ui.LayoutView(timeout=300)
                 c = discord.ui.Container(accent_colour=discord.Colour(0x7289DA))
-                c.add_item(discord.ui.TextDisplay(
-                    f"## 📍 Your Pin\n**Location:** {up.get('display_name', 'Unknown')}\n**Added:** {ts_fmt}"))
+                c.add_item(discord.ui.TextDisplay(text))
                 row = discord.ui.ActionRow()
                 edit_btn = discord.ui.Button(label="Edit", emoji="📍", style=discord.ButtonStyle.primary,
                                              custom_id=f"map_cv2_editpin:{guild_id}")
@@ -288,13 +326,11 @@ class MapV2Cog(commands.Cog):
     async def _cv2_remove_pin_callback(self, interaction: discord.Interaction):
         guild_id = str(interaction.guild.id)
         user_id = str(interaction.user.id)
-        if guild_id in self.maps and user_id in self.maps[guild_id].get('pins', {}):
-            del self.maps[guild_id]['pins'][user_id]
+        gmap = self.maps.get(guild_id)
+        if gmap and gmap.get('pins', {}).pop(user_id, None) is not None:
+            self._invalidate_pins_cache(int(guild_id))
             await self._delete_pin(int(guild_id), int(user_id))
-            await self._invalidate_map_cache(int(guild_id))
-            channel_id = self.maps[guild_id]['channel_id']
-            await self._update_map(int(guild_id), channel_id)
-            await self._update_global_overview()
+            self._schedule_update(int(guild_id))
             v = discord.ui.LayoutView(timeout=0)
             v.add_item(discord.ui.Container().add_item(discord.ui.TextDisplay("❌ Pin removed.")))
             await interaction.response.edit_message(view=v)
@@ -322,7 +358,7 @@ class MapV2Cog(commands.Cog):
         container.add_item(discord.ui.TextDisplay(
             "## 🖼️ Map Preview\n-# This is how your map will look with the new settings."))
         gallery = discord.ui.MediaGallery()
-        gallery.add_item(media="attachment://preview.png")
+        gallery.add_item(media=f"attachment://{preview_file.filename}")
         container.add_item(gallery)
         row = discord.ui.ActionRow()
         apply_btn = discord.ui.Button(label="Apply", emoji="✅", style=discord.ButtonStyle.success,
@@ -351,13 +387,11 @@ class MapV2Cog(commands.Cog):
                 message_id=interaction.message.id, attachments=[], view=v)
             return
         self._snapshots.pop(guild_id, None)
-        await self._save_data(guild_id)
-        await self._invalidate_map_cache(int(guild_id))
-        await self._update_map(int(guild_id), self.maps[guild_id]['channel_id'])
-        await self._update_global_overview()
+        await asyncio.gather(self._save_data(guild_id), self._invalidate_map_cache(int(guild_id)))
+        self._refresh_now(int(guild_id))
         v = discord.ui.LayoutView(timeout=1)
         v.add_item(discord.ui.Container().add_item(
-            discord.ui.TextDisplay("✅ Settings applied. Map updated.")))
+            discord.ui.TextDisplay("✅ Settings applied. The map is being updated.")))
         await interaction.followup.edit_message(
             message_id=interaction.message.id, attachments=[], view=v)
 
@@ -402,16 +436,29 @@ class MapV2Cog(commands.Cog):
             if not (hasattr(self.bot, 'db') and self.bot.db):
                 self.log.error("Database not available")
                 return
+            try:
+                # Not in databases created before the columns were added to schema.sql
+                await self.bot.db.maps.ensure_render_columns()
+            except Exception as e:
+                self.log.warning(f"Could not add render columns to map_settings, maps re-render on restart: {e}")
             self.maps = await self.bot.db.maps.load_all_maps()
             self.global_config = await self.bot.db.maps.get_all_global_config()
+            try:
+                # Not in databases created before the table was added to schema.sql
+                await self.bot.db.cache.ensure_geocode_table()
+            except Exception as e:
+                self.log.warning(f"Could not create geocode_cache, geocodes won't persist: {e}")
             await self.storage.cache.memory_cache.clear()
+            purged = await asyncio.to_thread(self.storage.cache.purge_stale_keys)
+            if purged:
+                self.log.info(f"Purged {purged} map cache files keyed by an older scheme")
 
-            for guild_id in list(self.maps.keys()):
-                try:
-                    guild = await self.bot.fetch_guild(int(guild_id))
-                    self._guild_names[guild_id] = guild.name
-                except Exception:
-                    self._guild_names[guild_id] = str(guild_id)
+            # Resolve guild names concurrently; the semaphore keeps us clear of rate limits
+            semaphore = asyncio.Semaphore(10)
+            await asyncio.gather(
+                *(self._fetch_guild_name(guild_id, semaphore) for guild_id in list(self.maps.keys())),
+                return_exceptions=True
+            )
 
             # Edit existing views on messages that still have IDs
             # NOTE: _update_map handles proper attachment+view regeneration.
@@ -434,6 +481,14 @@ class MapV2Cog(commands.Cog):
         except Exception as e:
             self.log.error(f"cog_load failed: {e}")
 
+    async def _fetch_guild_name(self, guild_id: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                guild = await self.bot.fetch_guild(int(guild_id))
+                self._guild_names[guild_id] = guild.name
+            except Exception:
+                self._guild_names[guild_id] = str(guild_id)
+
     async def _update_map(self, guild_id: int, channel_id: int, interaction=None):
         try:
             channel = self.bot.get_channel(channel_id)
@@ -443,38 +498,139 @@ class MapV2Cog(commands.Cog):
                 except (discord.NotFound, discord.Forbidden):
                     return
 
+            await self._prune_departed_pins(guild_id)
+            signature = self._map_signature(guild_id)
             map_file = await self._generate_map_image(guild_id)
             if not map_file:
                 return
-            map_file.filename = "map.png"
+            map_file.filename = "map" + Path(map_file.filename).suffix
 
             map_data = self.maps.get(str(guild_id), {})
-            view = self._build_map_card_view(guild_id)
+            view = self._build_map_card_view(guild_id, map_file.filename)
 
+            image_hash = hashlib.blake2b(map_file.fp.getvalue(), digest_size=16).hexdigest()
             existing_message_id = map_data.get('message_id')
             if existing_message_id:
                 try:
-                    message = await channel.fetch_message(existing_message_id)
-                    await message.edit(attachments=[map_file], view=view)
+                    # Edit by id; fetching the message first would cost an extra round trip
+                    message = channel.get_partial_message(existing_message_id)
+                    if map_data.get('attachment_hash') == image_hash:
+                        # Same bitmap as the one already posted, only refresh the card
+                        edit = message.edit(view=view)
+                    else:
+                        edit = message.edit(attachments=[map_file], view=view)
+                    # A stalled edit would hold the guild's update lock indefinitely
+                    await asyncio.wait_for(edit, timeout=MAP_EDIT_TIMEOUT)
+                    map_data['attachment_hash'] = image_hash
+                    await self._mark_rendered(guild_id, signature)
+                    return
+                except asyncio.TimeoutError:
+                    # The edit may still land, so don't post a second card; the
+                    # signature stays stale and the next change retries
+                    self.log.warning(f"Editing the map of guild {guild_id} timed out")
                     return
                 except discord.NotFound:
-                    pass
+                    # The failed upload consumed the buffer
+                    map_file.reset()
 
             message = await channel.send(file=map_file, view=view)
             if str(guild_id) not in self.maps:
                 self.maps[str(guild_id)] = {}
             self.maps[str(guild_id)]['message_id'] = message.id
+            self.maps[str(guild_id)]['attachment_hash'] = image_hash
             await self._save_data(str(guild_id))
+            await self._mark_rendered(guild_id, signature)
         except Exception as e:
             self.log.error(f"_update_map failed: {e}")
 
-    async def cog_unload(self):
-        self._apology_expiry_check.cancel()
-        for guild_id in list(self.maps.keys()):
+    async def _mark_rendered(self, guild_id: int, signature: str):
+        """Remember what the map card now shows, in memory and in its own columns."""
+        self._map_sigs[guild_id] = signature
+        map_data = self.maps.get(str(guild_id))
+        if map_data is not None:
+            map_data['rendered_signature'] = signature
             try:
-                await self._save_data(guild_id)
+                await self.bot.db.maps.set_render_state(guild_id, signature, map_data.get('attachment_hash'))
             except Exception as e:
-                self.log.warning(f"Save failed for {guild_id}: {e}")
+                # Only costs a re-render after the next restart
+                self.log.warning(f"Could not record render state for guild {guild_id}: {e}")
+
+    async def _refresh_card_view(self, guild_id: int, channel_id: int) -> bool:
+        """Re-attach the card's view without re-uploading the image; False if the message is gone."""
+        message_id = self.maps.get(str(guild_id), {}).get('message_id')
+        if not message_id:
+            return False
+        channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        view = self._build_map_card_view(guild_id, f"map.{bot_config.map_image_format}")
+        try:
+            await channel.get_partial_message(message_id).edit(view=view)
+        except discord.NotFound:
+            return False
+        return True
+
+    def _map_signature(self, guild_id: int) -> str:
+        """Digest of everything the map image shows: region, channel, look, pin positions and format.
+
+        Built from the stable final map cache key rather than hash(), so it
+        stays valid across restarts and is persisted in map_settings.rendered_signature.
+        """
+        gid = str(guild_id)
+        map_data = self.maps.get(gid, {})
+        final_key = self.storage.cache.generate_cache_key(
+            "final_map", gid, self.maps, region=map_data.get('region', 'world'))
+        return f"{final_key}_{map_data.get('channel_id')}_{bot_config.map_image_format}"
+
+    def _schedule_update(self, guild_id: int, delay: float = 2.0, max_delay: float = 10.0):
+        """Debounce map refreshes: every pin edit restarts a ``delay`` second timer.
+
+        A burst (e.g. a mass leave) therefore costs one render and one overview
+        rebuild. ``max_delay`` bounds how long a steady stream of edits can
+        postpone the refresh.
+        """
+        now = time.monotonic()
+        since = self._pending_since.setdefault(guild_id, now)
+        pending = self._pending_updates.get(guild_id)
+        if pending:
+            # Still sleeping; tasks leave the dict before they start rendering
+            pending.cancel()
+        wait = max(0.0, min(delay, since + max_delay - now))
+        self._pending_updates[guild_id] = asyncio.create_task(self._run_scheduled_update(guild_id, wait))
+
+    def _refresh_now(self, guild_id: int):
+        """Start a map refresh right away without waiting for it.
+
+        The caller can confirm to the user first instead of blocking on the
+        render and the Discord message edit.
+        """
+        self._schedule_update(guild_id, delay=0)
+
+    async def _run_scheduled_update(self, guild_id: int, delay: float):
+        await asyncio.sleep(delay)
+        # Edits arriving while we render schedule a fresh update
+        self._pending_updates.pop(guild_id, None)
+        self._pending_since.pop(guild_id, None)
+        # Serialise renders of one guild so a follow-up waits for the current one
+        async with self._update_locks.setdefault(guild_id, asyncio.Lock()):
+            map_data = self.maps.get(str(guild_id))
+            if not map_data:
+                return
+            if self._map_sigs.get(guild_id) == self._map_signature(guild_id):
+                # The burst cancelled itself out (e.g. re-pinned to the same spot)
+                self.log.debug(f"Map for guild {guild_id} unchanged, skipping refresh")
+                return
+            await self._update_map(guild_id, map_data['channel_id'])
+        await self._update_global_overview()
+
+    async def cog_unload(self):
+        self._apology_expiry_check.cancel()
+        for task in self._pending_updates.values():
+            task.cancel()
+        self._pending_updates.clear()
+        self._pending_since.clear()
+        if self._flush_task:
+            self._flush_task.cancel()
+        # Every other change is already in the database; write what is still queued
+        await self._flush_saves()
     async def _delayed_regen(self):
         """Regenerate maps after guild cache is fully populated."""
         await asyncio.sleep(12)
@@ -495,7 +651,7 @@ class MapV2Cog(commands.Cog):
                 self.maps[guild_id_str].pop('message_id', None)
                 if hasattr(self.bot, 'db') and self.bot.db:
                     try:
-                        await self.bot.db.maps.save_map_data(int(guild_id_str), self.maps[guild_id_str])
+                        await self.bot.db.maps.save_map_data(int(guild_id_str), self.maps[guild_id_str], include_pins=False)
                     except Exception:
                         pass
                 continue
@@ -511,8 +667,7 @@ class MapV2Cog(commands.Cog):
                 # Targeted delete of known orphans
                 for oid in list(known_orphans):
                     try:
-                        msg = await channel.fetch_message(oid)
-                        await msg.delete()
+                        await channel.get_partial_message(oid).delete()
                         deleted_total += 1
                         known_orphans.discard(oid)
                         self.log.info(f"Deleted orphan {oid} from channel {cid}")
@@ -536,15 +691,31 @@ class MapV2Cog(commands.Cog):
             self.log.info(f"Could not delete orphans: {known_orphans}")
         if deleted_total:
             self.log.info(f"Deleted {deleted_total} map messages total")
-        # Regenerate all maps that have a valid message_id
-        for guild_id_str, map_data in list(self.maps.items()):
-            cid = map_data.get('channel_id')
-            gid_int = int(guild_id_str)
-            if cid and map_data.get('message_id'):
-                try:
-                    await self._update_map(gid_int, cid)
-                except Exception:
-                    pass
+        # Restore all maps that have a valid message_id; guilds are independent,
+        # so run them side by side and let the semaphore keep us clear of rate limits
+        semaphore = asyncio.Semaphore(8)
+        await asyncio.gather(
+            *(self._restore_guild(guild_id_str, map_data, semaphore)
+              for guild_id_str, map_data in list(self.maps.items())),
+            return_exceptions=True
+        )
+
+    async def _restore_guild(self, guild_id_str: str, map_data: dict, semaphore: asyncio.Semaphore):
+        """Bring one guild's map card back after a restart, re-rendering only if it is stale."""
+        cid = map_data.get('channel_id')
+        if not (cid and map_data.get('message_id')):
+            return
+        gid_int = int(guild_id_str)
+        async with semaphore:
+            try:
+                signature = self._map_signature(gid_int)
+                # The posted image is still current; only the view needs re-attaching
+                if map_data.get('rendered_signature') == signature and await self._refresh_card_view(gid_int, cid):
+                    self._map_sigs[gid_int] = signature
+                    return
+                await self._update_map(gid_int, cid)
+            except Exception as e:
+                self.log.warning(f"Restoring map for guild {guild_id_str} failed: {e}")
 
     @tasks.loop(minutes=17)
     async def _apology_expiry_check(self):
@@ -568,63 +739,194 @@ class MapV2Cog(commands.Cog):
                     pass
 
     async def _save_data(self, guild_id: str):
-        """Save map data for specific guild to database."""
+        """Queue the map settings of a guild for writing to the database.
+
+        Writes are coalesced: a burst of changes within SAVE_DELAY seconds,
+        across any number of guilds, costs one upsert per guild. Pins are
+        written individually by _save_pin/_delete_pin and are not affected.
+        """
+        self._dirty_guilds.add(guild_id)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(SAVE_DELAY))
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        # Changes queued while the writes run start the next round
+        self._flush_task = None
+        await self._flush_saves()
+
+    async def _flush_saves(self):
+        """Write every queued guild's settings now."""
+        guild_ids = list(self._dirty_guilds)
+        self._dirty_guilds.clear()
+        results = await asyncio.gather(
+            *(self._write_settings(guild_id) for guild_id in guild_ids),
+            return_exceptions=True
+        )
+        for guild_id, result in zip(guild_ids, results):
+            if isinstance(result, Exception):
+                self.log.warning(f"Save failed for {guild_id}: {result}")
+
+    async def _write_settings(self, guild_id: str):
+        """Upsert the settings row of a guild, or delete it if the map is gone."""
         if hasattr(self.bot, 'db') and self.bot.db:
             guild_id_int = int(guild_id)
             if guild_id in self.maps:
-                await self.bot.db.maps.save_map_data(guild_id_int, self.maps[guild_id])
+                await self.bot.db.maps.save_map_data(guild_id_int, self.maps[guild_id], include_pins=False)
             else:
                 await self.bot.db.maps.delete_settings(guild_id_int)
 
+    async def _save_pin(self, guild_id: str, user_id: str):
+        """Upsert a single pin row."""
+        if hasattr(self.bot, 'db') and self.bot.db:
+            pin = self.maps[guild_id]['pins'][user_id]
+            await self.bot.db.maps.set_pin(
+                guild_id=int(guild_id),
+                user_id=int(user_id),
+                latitude=pin['lat'],
+                longitude=pin['lng'],
+                username=pin.get('username'),
+                display_name=pin.get('display_name'),
+                location=pin.get('location'),
+                color=pin.get('color', '#FF0000'),
+                avatar_hash=pin.get('avatar_hash'),
+                country_code=pin.get('country_code')
+            )
+
     async def _delete_pin(self, guild_id: int, user_id: int):
         if hasattr(self.bot, 'db') and self.bot.db:
             await self.bot.db.maps.delete_pin(guild_id, user_id)
 
+    async def _prune_departed_pins(self, guild_id: int, limit: int = 50) -> int:
+        """Drop pins of users who left while the bot wasn't watching (restarts, missed events).
+
+        Only runs once the guild's member list is fully cached, otherwise every
+        uncached member would look departed. Removes at most ``limit`` pins per call.
+        """
+        guild = self.bot.get_guild(guild_id)
+        pins = self.maps.get(str(guild_id), {}).get('pins')
+        if not guild or not guild.chunked or not pins:
+            return 0
+        stale = list(islice((uid for uid in pins if guild.get_member(int(uid)) is None), limit))
+        if not stale:
+            return 0
+        for uid in stale:
+            pins.pop(uid, None)
+        self._invalidate_pins_cache(guild_id)
+        if hasattr(self.bot, 'db') and self.bot.db:
+            await self.bot.db.maps.delete_pins(guild_id, [int(uid) for uid in stale])
+        self.log.info(f"Pruned {len(stale)} pins of departed members in guild {guild_id}")
+        return len(stale)
+
     async def _invalidate_map_cache(self, guild_id: int):
+        self._pin_arrays.pop(str(guild_id), None)
+        self._map_sigs.pop(int(guild_id), None)
         await self.storage.invalidate_map_cache(guild_id)
 
+    def _invalidate_pins_cache(self, guild_id: int):
+        """Pin changes only affect the final map; keep the rendered base map.
+
+        Call right after changing the pins and before the next await, so no
+        render in between picks up _pins_soa() arrays of the previous pins.
+        Encoded maps are keyed by their pin positions, so nothing needs purging:
+        the card keeps showing the previous image until the scheduled render
+        swaps the new one in, and the old entry is released then.
+        """
+        self._pin_arrays.pop(str(guild_id), None)
+
+    def _forget_guild(self, guild_id: int):
+        """Drop the per-guild render state of a deleted map."""
+        pending = self._pending_updates.pop(guild_id, None)
+        if pending:
+            pending.cancel()
+        self._pending_since.pop(guild_id, None)
+        self._update_locks.pop(guild_id, None)
+        self._map_sigs.pop(guild_id, None)
+        self._pin_arrays.pop(str(guild_id), None)
+        self._snapshots.pop(str(guild_id), None)
+
+    def _pins_soa(self, guild_id: str) -> Dict[str, np.ndarray]:
+        """Pins of a guild as parallel arrays, rebuilt lazily after pin changes.
+
+        'user_ids' fixes the row order; 'lat'/'lng' are degrees and
+        'lat_rad'/'lng_rad' radians. self.maps stays the source of truth.
+        """
+        pins = self.maps.get(guild_id, {}).get('pins', {})
+        arrays = self._pin_arrays.get(guild_id)
+        # The length check covers renders racing a mutation before its invalidation
+        if arrays is None or len(arrays['user_ids']) != len(pins):
+            user_ids = np.array(list(pins), dtype=object)
+            lat = np.fromiter((pins[u]['lat'] for u in user_ids), dtype=np.float64, count=len(user_ids))
+            lng = np.fromiter((pins[u]['lng'] for u in user_ids), dtype=np.float64, count=len(user_ids))
+            arrays = self._pin_arrays[guild_id] = {
+                'user_ids': user_ids,
+                'lat': lat,
+                'lng': lng,
+                'lat_rad': np.radians(lat),
+                'lng_rad': np.radians(lng),
+            }
+        return arrays
+
+    def _nearby_pin_count(self, guild_id: str, user_id: str, radius_km: float = NEARBY_RADIUS_KM) -> int:
+        """Count other pins within radius_km of a user's pin."""
+        pin = self.maps.get(guild_id, {}).get('pins', {}).get(user_id)
+        if not pin:
+            return 0
+        arrays = self._pins_soa(guild_id)
+        mask = self.map_generator.within_radius(arrays['lat_rad'], arrays['lng_rad'], pin['lat'], pin['lng'], radius_km)
+        return max(0, int(mask.sum()) - 1)
+
     async def _delete_map_message(self, map_data: dict):
         channel_id = map_data.get('channel_id')
         message_id = map_data.get('message_id')
         if channel_id and message_id:
             try:
                 channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
-                message = await channel.fetch_message(message_id)
-                await message.delete()
+                await channel.get_partial_message(message_id).delete()
             except Exception:
                 pass
 
     async def _generate_map_image(self, guild_id: int, progress_callback=None) -> Optional[discord.File]:
         try:
-            map_data = self.maps.get(str(guild_id), {})
+            gid = str(guild_id)
+            # Render from a copy taken before the first await: edits landing meanwhile
+            # must not get this image cached under their cache key
+            maps = self._render_state(gid)
+            arrays = self._pins_soa(gid)
+            map_data = maps[gid]
             region = map_data.get('region', 'world')
-            pins = map_data.get('pins', {})
+            pins = map_data['pins']
             width, height = self.map_generator.calculate_image_dimensions(region)
 
-            base_map = await self.storage.get_cached_base_map(region, width, height, str(guild_id), self.maps)
-            projection_func = None
-            if not base_map:
-                base_map, projection_func = await self.map_generator.render_geopandas_map(
-                    region, width, height, str(guild_id), self.maps)
-                if base_map:
-                    await self.storage.cache_base_map(region, width, height, base_map, str(guild_id), self.maps)
-            else:
-                projection_func = self._create_projection_function(region, width, height)
-
-            if not base_map or not projection_func:
-                land_color, water_color = self.map_generator.get_map_colors(str(guild_id), self.maps)
-                base_map = PILImage.new('RGB', (width, height), color=water_color)
-                projection_func = self._create_projection_function(region, width, height)
-
-            pin_color, custom_pin_size = self.map_generator.get_pin_settings(str(guild_id), self.maps)
-            base_pin_size = int(height * custom_pin_size / 2400)
-            pin_groups = self.map_generator.group_overlapping_pins(pins, projection_func, base_pin_size)
-            self.map_generator.draw_pins_on_map(base_map, pin_groups, width, height, base_pin_size,
-                                                str(guild_id), self.maps)
-            img_buffer = BytesIO()
-            base_map.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            return discord.File(img_buffer, filename=f"map_{region}.png")
+            # Forced refreshes and re-sends often find nothing changed since the last render
+            cached = await self.storage.get_encoded_map(guild_id, maps, bot_config.map_image_format)
+            if cached:
+                return discord.File(BytesIO(cached), filename=f"map_{region}.{bot_config.map_image_format}")
+
+            async with self._render_semaphore:
+                base_map = await self.storage.get_cached_base_map(region, width, height, gid, maps)
+                projection_func = None
+                if not base_map:
+                    base_map, projection_func = await self.map_generator.render_geopandas_map(
+                        region, width, height, gid, maps)
+                    if base_map:
+                        await self.storage.cache_base_map(region, width, height, base_map, gid, maps)
+                else:
+                    projection_func = self._create_projection_function(region, width, height)
+
+                if not base_map or not projection_func:
+                    land_color, water_color = self.map_generator.get_map_colors(gid, maps)
+                    base_map = PILImage.new('RGB', (width, height), color=water_color)
+                    projection_func = self._create_projection_function(region, width, height)
+
+                await asyncio.to_thread(self._draw_pins, base_map, pins, arrays,
+                                        projection_func, width, height, gid, maps)
+                # Encoding a 3000px image takes hundreds of ms; keep it off the event loop
+                img_buffer, ext = await run_encode(encode_map_image, base_map)
+            if ext == 'png':
+                img_buffer = await optimize_png(img_buffer)
+            await self.storage.cache_encoded_map(guild_id, maps, img_buffer.getvalue(), ext)
+            return discord.File(img_buffer, filename=f"map_{region}.{ext}")
         except Exception as e:
             self.log.error(f"generate_map_image failed: {e}")
             return None
@@ -632,61 +934,57 @@ class MapV2Cog(commands.Cog):
     async def _generate_preview_map(self, guild_id: int, preview_settings: Dict, progress_callback=None):
         """Generate map with override settings without modifying self.maps."""
         try:
-            map_data = self.maps.get(str(guild_id), {})
+            gid = str(guild_id)
+            # Pins as of the request; pin edits during the render don't mix in
+            map_data = self._render_state(gid)[gid]
+            arrays = self._pins_soa(gid)
             region = map_data.get('region', 'world')
-            pins = map_data.get('pins', {})
+            pins = map_data['pins']
             width, height = self.map_generator.calculate_image_dimensions(region)
 
             # Merge preview settings over original for color generation
-            temp_maps = {str(guild_id): {**map_data, 'settings': preview_settings}}
-            # Force cache miss so colors apply
-            base_map, projection_func = await self.map_generator.render_geopandas_map(
-                region, width, height, str(guild_id), temp_maps)
-
-            if not base_map or not projection_func:
-                land_color, water_color = self.map_generator.get_map_colors(str(guild_id), temp_maps)
-                base_map = PILImage.new('RGB', (width, height), color=water_color)
-                projection_func = self._create_projection_function(region, width, height)
-
-            pin_color, custom_pin_size = self.map_generator.get_pin_settings(str(guild_id), temp_maps)
-            base_pin_size = int(height * custom_pin_size / 2400)
-            pin_groups = self.map_generator.group_overlapping_pins(pins, projection_func, base_pin_size)
-            self.map_generator.draw_pins_on_map(base_map, pin_groups, width, height, base_pin_size,
-                                                str(guild_id), temp_maps)
-
-            img_buffer = BytesIO()
-            base_map.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            return (discord.File(img_buffer, filename="preview.png"), base_map)
+            temp_maps = {gid: {**map_data, 'settings': preview_settings}}
+            async with self._render_semaphore:
+                # Force cache miss so colors apply
+                base_map, projection_func = await self.map_generator.render_geopandas_map(
+                    region, width, height, gid, temp_maps)
+
+                if not base_map or not projection_func:
+                    land_color, water_color = self.map_generator.get_map_colors(gid, temp_maps)
+                    base_map = PILImage.new('RGB', (width, height), color=water_color)
+                    projection_func = self._create_projection_function(region, width, height)
+
+                await asyncio.to_thread(self._draw_pins, base_map, pins, arrays,
+                                        projection_func, width, height, gid, temp_maps)
+                # Previews are shown once and discarded, so encode speed beats size
+                img_buffer, ext = await run_encode(encode_map_image, base_map, fast=True)
+            return (discord.File(img_buffer, filename=f"preview.{ext}"), base_map)
         except Exception as e:
             self.log.error(f"_generate_preview_map failed: {e}")
             return (None, None)
 
+    def _render_state(self, guild_id: str) -> Dict[str, Dict]:
+        """Copy of one guild's map state, shaped like self.maps, for a render spanning awaits.
+
+        Pin dicts are replaced on edit, never changed in place, so copying the
+        pin mapping is enough; everything else is small and copied deeply.
+        """
+        map_data = self.maps.get(guild_id, {})
+        state = deepcopy({key: value for key, value in map_data.items() if key != 'pins'})
+        state['pins'] = dict(map_data.get('pins', {}))
+        return {guild_id: state}
+
+    def _draw_pins(self, base_map: PILImage.Image, pins: Dict, arrays: Dict[str, np.ndarray],
+                   projection_func, width: int, height: int, guild_id: str, maps: Dict):
+        """Group and draw pins onto ``base_map``; blocking, meant for a worker thread."""
+        pin_color, custom_pin_size = self.map_generator.get_pin_settings(guild_id, maps)
+        base_pin_size = int(height * custom_pin_size / 2400)
+        pin_groups = self.map_generator.group_overlapping_pins(pins, projection_func, base_pin_size, arrays)
+        self.map_generator.draw_pins_on_map(base_map, pin_groups, width, height, base_pin_size, guild_id, maps)
+
     def _create_projection_function(self, region: str, width: int, height: int):
-        data_path = Path(__file__).parent / "map_data"
-        bounds = self.map_generator.map_config.get_region_bounds(region, data_path)
-        (lat0, lon0), (lat1, lon1) = bounds
-        minx, miny, maxx, maxy = lon0, lat0, lon1, lat1
-        if region == "germany":
-            try:
-                base_path = Path(__file__).parent / "map_data"
-                world = gpd.read_file(base_path / "ne_10m_admin_0_countries.shp")
-                de = world[world["ADMIN"] == "Germany"].geometry.unary_union
-                if de is not None:
-                    minx, miny, maxx, maxy = de.bounds
-            except Exception:
-                pass
-        # Mercator projection matching calculate_image_dimensions() aspect ratio
-        def _merc_y(lat):
-            return math.log(math.tan((90 + lat) * math.pi / 360))
-        y_min = _merc_y(miny)
-        y_max = _merc_y(maxy)
-        y_range = y_max - y_min
-        def to_px(lat, lon):
-            x = (lon - minx) / (maxx - minx) * width
-            y = (y_max - _merc_y(lat)) / y_range * height if y_range else 0
-            return (int(x), int(y))
-        return to_px
+        # Shares bounds with the base map renderer and is cached per (region, width, height)
+        return self.map_generator.get_region_projection(region, width, height)
 
     async def _update_global_overview(self):
         pass
@@ -698,10 +996,9 @@ class MapV2Cog(commands.Cog):
         if gid in self.maps:
             return False, "A map already exists for this server."
         self.maps[gid] = {'region': region, 'channel_id': channel_id, 'pins': {},
-                           'created_at': datetime.now().isoformat(), 'created_by': created_by}
+                           'created_at': int(time.time()), 'created_by': created_by}
         await self._save_data(gid)
-        await self._update_map(guild_id, channel_id)
-        await self._update_global_overview()
+        self._refresh_now(guild_id)
         return True, None
 
     async def dash_regenerate(self, guild_id: int):
@@ -709,8 +1006,7 @@ class MapV2Cog(commands.Cog):
         if gid not in self.maps:
             return
         await self._invalidate_map_cache(int(gid))
-        await self._update_map(guild_id, self.maps[gid]['channel_id'])
-        await self._update_global_overview()
+        self._refresh_now(guild_id)
 
     async def dash_delete_map(self, guild_id: int):
         gid = str(guild_id)
@@ -718,9 +1014,11 @@ class MapV2Cog(commands.Cog):
             return 0
         pin_count = len(self.maps[gid].get('pins', {}))
         await self._delete_map_message(self.maps[gid])
-        await self._invalidate_map_cache(int(gid))
         del self.maps[gid]
         await self._save_data(gid)
+        # Nothing will render this guild again, so drop its state instead of invalidating it
+        self._forget_guild(guild_id)
+        await self.storage.drop_guild_cache(guild_id)
         await self._update_global_overview()
         return pin_count
 
@@ -729,9 +1027,8 @@ class MapV2Cog(commands.Cog):
         if gid not in self.maps:
             return
         self.maps[gid]['region'] = region
-        await self._save_data(gid)
-        await self._invalidate_map_cache(int(gid))
-        await self._update_map(guild_id, self.maps[gid]['channel_id'])
+        await asyncio.gather(self._save_data(gid), self._invalidate_map_cache(int(gid)))
+        self._refresh_now(guild_id)
 
     async def dash_set_channel(self, guild_id: int, new_channel_id: int):
         gid = str(guild_id)
@@ -741,11 +1038,68 @@ class MapV2Cog(commands.Cog):
         self.maps[gid]['channel_id'] = new_channel_id
         self.maps[gid].pop('message_id', None)
         await self._save_data(gid)
-        await self._update_map(guild_id, new_channel_id)
-        await self._update_global_overview()
+        self._refresh_now(guild_id)
 
     # ── Legacy pin handlers (called by map_views) ──────────────────────
 
+    async def _geocode_and_validate(self, location: str, region: str):
+        """Geocode a location and check it against the map region.
+
+        Returns ((lat, lng, display_name, country_code), None) on success,
+        or (None, error_text) ready to show to the user."""
+        result = await self._geocode(location)
+        if not result:
+            return None, f"⛔ Could not find **'{location}'**. Try a more specific location."
+        lat, lng = result[0], result[1]
+        if not self.map_generator.region_contains(region, lat, lng):
+            return None, f"⛔ **'{location}'** is outside the **{region}** map region."
+        return result, None
+
+    async def _geocode(self, location: str):
+        """Geocode a location, answering repeat queries from memory or the database.
+
+        Queries are matched case- and whitespace-insensitively, and concurrent
+        lookups of the same query share one Nominatim request. Failed lookups
+        are not cached, since they are often transient.
+        """
+        query = " ".join(location.split()).casefold()
+        result = await self._geocode_cache.get(query)
+        if result:
+            return result
+        task = self._geocode_inflight.get(query)
+        if task is None:
+            task = self._geocode_inflight[query] = asyncio.create_task(self._geocode_uncached(query, location))
+            task.add_done_callback(lambda _: self._geocode_inflight.pop(query, None))
+        return await asyncio.shield(task)
+
+    async def _geocode_uncached(self, query: str, location: str):
+        has_db = hasattr(self.bot, 'db') and self.bot.db
+        result = None
+        if has_db:
+            try:
+                result = await self.bot.db.cache.get_geocode(query)
+            except Exception as e:
+                self._geocode_db_failed("read", query, e)
+        if not result:
+            result = await self.map_generator.geocode_location(location)
+            if not result:
+                return None
+            if has_db:
+                try:
+                    await self.bot.db.cache.set_geocode(query, *result)
+                except Exception as e:
+                    self._geocode_db_failed("write", query, e)
+        await self._geocode_cache.set(query, result)
+        return result
+
+    def _geocode_db_failed(self, action: str, query: str, error: Exception):
+        """Report a geocode_cache failure; loudly the first time, since lookups still work without it."""
+        if not self._geocode_db_warned:
+            self._geocode_db_warned = True
+            self.log.warning(f"Geocode cache {action} failed for '{query}', falling back to Nominatim: {error}")
+        else:
+            self.log.debug(f"Geocode cache {action} failed for '{query}': {error}")
+
     async def _handle_pin_location(self, interaction: discord.Interaction, location: str):
         """Geocode location, save pin, regenerate map — CV2."""
         guild_id = str(interaction.guild.id)
@@ -761,28 +1115,17 @@ class MapV2Cog(commands.Cog):
 
         is_update = user_id in self.maps[guild_id].get('pins', {})
 
-        result = await self.map_generator.geocode_location(location)
-        if not result:
+        result, error = await self._geocode_and_validate(location, self.maps[guild_id]['region'])
+        if error:
             v = discord.ui.LayoutView(timeout=0)
             c = discord.ui.Container()
-            c.add_item(discord.ui.TextDisplay(f"⛔ Could not find **'{location}'**. Try a more specific location."))
+            c.add_item(discord.ui.TextDisplay(error))
             v.add_item(c)
             await interaction.followup.send(view=v, ephemeral=True)
             return
 
         lat, lng, display_name, country_code = result
 
-        region = self.maps[guild_id]['region']
-        data_path = Path(__file__).parent / "map_data"
-        bounds = self.map_generator.map_config.get_region_bounds(region, data_path)
-        if not (bounds[0][0] <= lat <= bounds[1][0] and bounds[0][1] <= lng <= bounds[1][1]):
-            v = discord.ui.LayoutView(timeout=0)
-            c = discord.ui.Container()
-            c.add_item(discord.ui.TextDisplay(f"⛔ **'{location}'** is outside the **{region}** map region."))
-            v.add_item(c)
-            await interaction.followup.send(view=v, ephemeral=True)
-            return
-
         avatar_hash = interaction.user.avatar.key if interaction.user.avatar else None
         pin_data = {
             'username': interaction.user.display_name,
@@ -790,17 +1133,15 @@ class MapV2Cog(commands.Cog):
             'display_name': display_name,
             'lat': lat,
             'lng': lng,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': int(time.time()),
             'avatar_hash': avatar_hash,
             'country_code': country_code,
         }
         self.maps[guild_id].setdefault('pins', {})[user_id] = pin_data
+        self._invalidate_pins_cache(int(guild_id))
 
-        await self._save_data(guild_id)
-        await self._invalidate_map_cache(int(guild_id))
-        channel_id = self.maps[guild_id]['channel_id']
-        await self._update_map(int(guild_id), channel_id)
-        await self._update_global_overview()
+        await self._save_pin(guild_id, user_id)
+        self._schedule_update(int(guild_id))
 
         v = discord.ui.LayoutView(timeout=0)
         c = discord.ui.Container()
@@ -829,22 +1170,13 @@ class MapV2Cog(commands.Cog):
             await modal_interaction.followup.send(view=_err("⛔ No pin found to update."), ephemeral=True)
             return
 
-        result = await self.map_generator.geocode_location(location)
-        if not result:
-            await modal_interaction.followup.send(
-                view=_err(f"⛔ Could not find **'{location}'**."), ephemeral=True)
+        result, error = await self._geocode_and_validate(location, self.maps[guild_id]['region'])
+        if error:
+            await modal_interaction.followup.send(view=_err(error), ephemeral=True)
             return
 
         lat, lng, display_name, country_code = result
 
-        region = self.maps[guild_id]['region']
-        data_path = Path(__file__).parent / "map_data"
-        bounds = self.map_generator.map_config.get_region_bounds(region, data_path)
-        if not (bounds[0][0] <= lat <= bounds[1][0] and bounds[0][1] <= lng <= bounds[1][1]):
-            await modal_interaction.followup.send(
-                view=_err(f"⛔ **'{location}'** is outside the **{region}** map region."), ephemeral=True)
-            return
-
         old_location = self.maps[guild_id]['pins'][user_id].get('location', 'Unknown')
         avatar_hash = interaction.user.avatar.key if interaction.user.avatar else None
         pin_data = {
@@ -853,17 +1185,15 @@ class MapV2Cog(commands.Cog):
             'display_name': display_name,
             'lat': lat,
             'lng': lng,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': int(time.time()),
             'avatar_hash': avatar_hash,
             'country_code': country_code,
         }
         self.maps[guild_id]['pins'][user_id] = pin_data
+        self._invalidate_pins_cache(int(guild_id))
 
-        await self._save_data(guild_id)
-        await self._invalidate_map_cache(int(guild_id))
-        channel_id = self.maps[guild_id]['channel_id']
-        await self._update_map(int(guild_id), channel_id)
-        await self._update_global_overview()
+        await self._save_pin(guild_id, user_id)
+        self._schedule_update(int(guild_id))
 
         # Remove the stale "Your Pin" card that launched this edit.
         if source_interaction is not None and source_interaction.message is not None:
@@ -878,24 +1208,18 @@ class MapV2Cog(commands.Cog):
             f"📌 Pin updated\n{old_location} → **{display_name}**"))
         v.add_item(c)
         await modal_interaction.followup.send(view=v, ephemeral=True)
-    async def _apply_cached_preview_as_map(self, guild_id: int, cached_preview: BytesIO) -> bool:
-        pass
-
-    async def _generate_fast_pin_preview(self, guild_id: int, preview_settings: Dict):
-        pass
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
         try:
             guild_id = str(member.guild.id)
             user_id = str(member.id)
-            if guild_id in self.maps and user_id in self.maps[guild_id].get('pins', {}):
-                del self.maps[guild_id]['pins'][user_id]
+            gmap = self.maps.get(guild_id)
+            if gmap and gmap.get('pins', {}).pop(user_id, None) is not None:
+                self._invalidate_pins_cache(int(guild_id))
                 await self._delete_pin(int(guild_id), int(user_id))
-                await self._invalidate_map_cache(int(guild_id))
-                channel_id = self.maps[guild_id]['channel_id']
-                await self._update_map(int(guild_id), channel_id)
-                await self._update_global_overview()
+                # Mass leaves (prunes, raid cleanup) collapse into one refresh
+                self._schedule_update(int(guild_id))
         except Exception as e:
             self.log.info(f"Error removing pin for leaving member: {e}")
 
@@ -919,7 +1243,7 @@ class MapV2Cog(commands.Cog):
         if user_id in self.maps[guild_id].get('pins', {}):
             up = self.maps[guild_id]['pins'][user_id]
             embed = discord.Embed(title="📍 Your Current Location",
-                description=f"**Location:** {up.get('display_name', 'Unknown')}\n**Added:** {up.get('timestamp', 'Unknown')}",
+                description=f"**Location:** {up.get('display_name', 'Unknown')}\n**Added:** {_pin_time(up.get('timestamp'), 'R')}",
                 color=0x7289da)
             view = UserPinOptionsView(self, int(guild_id))
             await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
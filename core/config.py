@@ -111,6 +111,24 @@ class BotConfig:
     def max_connections_per_host(self) -> int:
         return int(os.getenv("MAX_HTTP_CONNECTIONS_PER_HOST", "10"))
     
+    # Map Rendering Configuration
+    @property
+    def map_image_format(self) -> str:
+        fmt = os.getenv("MAP_IMAGE_FORMAT", "webp").lower()
+        return fmt if fmt in ("webp", "png") else "webp"
+    
+    @property
+    def map_webp_effort(self) -> int:
+        return int(os.getenv("MAP_WEBP_EFFORT", "0"))
+    
+    @property
+    def map_png_compress_level(self) -> int:
+        return int(os.getenv("MAP_PNG_COMPRESS_LEVEL", "6"))
+    
+    @property
+    def map_oxipng_enabled(self) -> bool:
+        return os.getenv("MAP_OXIPNG", "false").lower() in ("1", "true", "yes")
+    
     # Monitor Configuration
     @property
     def monitor_authorized_roles(self) -> List[int]:
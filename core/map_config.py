@@ -2,9 +2,13 @@
 
 from typing import Union, Tuple, Dict
 import math
-import geopandas as gpd
 from pathlib import Path
 
+from core.map_shapes import country_outline
+
+# Countries with overseas territories whose shapefile bounds would span the globe
+OVERSEAS_TERRITORY_COUNTRIES = frozenset({'france', 'spain', 'unitedkingdom', 'netherlands', 'denmark', 'portugal'})
+
 
 class MapConfig:
     """Central configuration for map appearance and behavior."""
@@ -399,33 +403,18 @@ class MapConfig:
                 
             country_name = self.COUNTRY_NAME_MAPPING[country_key]
             
-            # Load the world countries shapefile
-            world_file = data_path / "ne_10m_admin_0_countries.shp"
-            if not world_file.exists():
-                return None
-                
-            world = gpd.read_file(world_file)
-            
-            # Special handling for Ukraine - include all territories (including Crimea)
+            # Special handling for Ukraine - include all territories (including Crimea).
+            # For other countries ADMIN == country_name gives the mainland only; if several
+            # rows match, only the largest by area is kept.
             if country_key == 'ukraine':
-                country_rows = world[world["SOVEREIGNT"] == country_name]
+                country_geom = country_outline("SOVEREIGNT", country_name, False, data_path)
             else:
-                # For countries with overseas territories, use ADMIN == country_name to get mainland only
-                # This excludes dependencies that have different ADMIN names
-                country_rows = world[world["ADMIN"] == country_name]
-                
-                # Additional filter: exclude very small or distant territories
-                if not country_rows.empty and len(country_rows) > 1:
-                    # If multiple rows, keep only the largest by area
-                    country_rows['area'] = country_rows.geometry.area
-                    largest_idx = country_rows['area'].idxmax()
-                    country_rows = country_rows.loc[[largest_idx]]
+                country_geom = country_outline("ADMIN", country_name, True, data_path)
             
-            if country_rows.empty:
+            if country_geom is None:
                 return None
             
             # Get geometry and bounds
-            country_geom = country_rows.geometry.unary_union
             bounds = country_geom.bounds
             minx, miny, maxx, maxy = bounds
             
@@ -448,12 +437,10 @@ class MapConfig:
     
     def get_region_bounds(self, region_key: str, data_path: Path = None) -> Tuple[Tuple[float, float], Tuple[float, float]]:
         """Get region bounds, using hardcoded values for countries with overseas territories."""
-        # Countries with problematic overseas territories - use hardcoded bounds
-        overseas_territory_countries = {'france', 'spain', 'unitedkingdom', 'netherlands', 'denmark', 'portugal'}
-        
-        # For countries without overseas territory issues, try shapefile first
+        # For countries without overseas territory issues, try shapefile first;
+        # the others use hardcoded bounds
         if (region_key in self.COUNTRY_NAME_MAPPING and 
-            region_key not in overseas_territory_countries):
+            region_key not in OVERSEAS_TERRITORY_COUNTRIES):
             shapefile_bounds = self.get_country_bounds_from_shapefile(region_key, data_path)
             if shapefile_bounds:
                 return shapefile_bounds
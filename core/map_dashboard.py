@@ -27,6 +27,8 @@ REGIONS = [
     ("🇧🇷 Brazil", "brazil"), ("🇨🇦 Canada", "canada"), ("🇲🇽 Mexico", "mexico"),
 ]
 _REGION_LABEL = {value: label for label, value in REGIONS}
+# The change-region select has no per-view state, so its options are built once
+_REGION_OPTIONS = tuple(discord.SelectOption(label=label, value=value) for label, value in REGIONS)
 
 
 def notice_view(text: str, color: int = GREEN) -> discord.ui.LayoutView:
@@ -128,11 +130,14 @@ class MapManageLayout(discord.ui.LayoutView):
         pins = len(map_data.get('pins', {}))
         region = map_data.get('region', 'world')
         custom = "yes" if map_data.get('settings') else "no"
+        created_at = map_data.get('created_at')
+        # Epoch seconds, rendered by the Discord client in the viewer's timezone
+        created = f" · Created <t:{created_at}:D>" if isinstance(created_at, int) else ""
         container = discord.ui.Container(accent_colour=discord.Colour(BLURPLE))
         container.add_item(discord.ui.TextDisplay(
             f"## 🗺️ Map Dashboard\n"
             f"-# Channel: {_channel_name(guild, map_data.get('channel_id'))} · "
-            f"Region: {_REGION_LABEL.get(region, region)} · Pins: {pins} · Custom style: {custom}"))
+            f"Region: {_REGION_LABEL.get(region, region)} · Pins: {pins} · Custom style: {custom}{created}"))
         container.add_item(discord.ui.Separator())
         row1 = discord.ui.ActionRow()
         row1.add_item(_RegionButton(cog))
@@ -176,7 +181,7 @@ class _RegenerateButton(discord.ui.Button):
         await interaction.response.defer()
         await self.cog.dash_regenerate(interaction.guild.id)
         await interaction.edit_original_response(view=await build_map_dashboard(self.cog, interaction.guild.id))
-        await interaction.followup.send(view=notice_view("♻️ **Map regenerated**"), ephemeral=True)
+        await interaction.followup.send(view=notice_view("♻️ **Map is being regenerated**"), ephemeral=True)
 
 
 class _StyleButton(discord.ui.Button):
@@ -218,8 +223,7 @@ class MapRegionSelectLayout(discord.ui.LayoutView):
 
 class _RegionSelect(discord.ui.Select):
     def __init__(self, cog):
-        options = [discord.SelectOption(label=label, value=value) for label, value in REGIONS]
-        super().__init__(placeholder="Pick a new region...", options=options, min_values=1, max_values=1)
+        super().__init__(placeholder="Pick a new region...", options=list(_REGION_OPTIONS), min_values=1, max_values=1)
         self.cog = cog
 
     async def callback(self, interaction: discord.Interaction):
@@ -2,15 +2,168 @@
 
 import math
 import asyncio
+import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Tuple, List, Callable, Union
 from io import BytesIO
+import numpy as np
+import shapely
 from PIL import Image, ImageDraw, ImageFont
-import geopandas as gpd
 from shapely.geometry import box
-import aiohttp
 
+from core.config import config as bot_config
+from core.http_client import http_client
 from core.map_config import MapConfig
+from core.map_shapes import LAYER_FILES, load_layer, germany_bounds
+
+try:
+    import oxipng
+except ImportError:
+    oxipng = None
+
+# Distinct map sizes whose transparent pin layer is kept for reuse
+PIN_LAYER_POOL_SIZE = 4
+
+# Fraction of the view span kept around the map when clipping filled polygons
+POLYGON_CLIP_MARGIN = 0.05
+
+# Overlap thresholds beyond the image edge at which pins are left out of grouping
+PIN_CULL_MARGIN = 8
+
+# Edge of the square tiles the pin layer is blended in; only tiles holding pins are touched
+PIN_TILE_SIZE = 64
+
+# Full-size encodes allowed at once; each one holds a core and a multi-megabyte buffer
+MAX_CONCURRENT_ENCODES = 2
+_encode_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ENCODES)
+
+
+def to_palette(image: Image.Image) -> Image.Image:
+    """Convert a map to an 8-bit palette image, losslessly.
+
+    Rendered maps use only a handful of flat colours, so they are mapped onto
+    their exact colour set; this cuts PNG size by about a third at a lower
+    encode cost. Images with more than 256 colours (custom colours plus
+    anti-aliased text) are returned as RGB and stay truecolour.
+    """
+    if image.mode == 'P':
+        return image
+    image = image.convert('RGB')
+    colors = image.getcolors(256)
+    if colors is None:
+        return image
+    palette = Image.new('P', (1, 1))
+    palette.putpalette([channel for _, color in colors for channel in color])
+    return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+@lru_cache(maxsize=64)
+def count_font(size: int) -> ImageFont.ImageFont:
+    """Font for the pin count of a group, loaded once per size.
+
+    Falls back to Pillow's built-in font where Arial is not installed, which
+    is the common case on servers; either way the lookup costs a file search.
+    """
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def encode_png(image: Image.Image, compress_level: int = None, palette: bool = True) -> BytesIO:
+    """Encode an image as PNG at a fixed zlib level, as a palette image by default.
+
+    optimize=True retries zlib at maximum effort for a few percent gain; size
+    reduction is left to the optional oxipng pass in optimize_png().
+    """
+    if compress_level is None:
+        compress_level = bot_config.map_png_compress_level
+    if palette:
+        image = to_palette(image)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=compress_level)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_map_image(image: Image.Image, fast: bool = False) -> Tuple[BytesIO, str]:
+    """Encode a finished map in the configured format, returning (buffer, extension).
+
+    Lossless WebP is about half the size of PNG for these flat-colour rasters
+    and encodes faster; lossy WebP blurs borders and ends up larger. WebP
+    builds its own colour index for images this flat, so it is not quantized.
+    For lossless WebP, ``quality`` is the encoder effort; encoding dominates a
+    pin update once the base map is cached, so the default keeps it low.
+    ``fast`` is for throwaway images such as previews: PNGs then use zlib
+    level 1, which encodes about a third faster for larger files.
+    """
+    if bot_config.map_image_format == 'webp':
+        buffer = BytesIO()
+        image.save(buffer, format='WEBP', lossless=True, method=4, quality=bot_config.map_webp_effort)
+        buffer.seek(0)
+        return buffer, 'webp'
+    return encode_png(image, compress_level=1 if fast else None), 'png'
+
+
+async def run_encode(func: Callable, *args, **kwargs):
+    """Run a blocking encode of a full-size map in a worker thread.
+
+    Pillow and oxipng release the GIL while compressing, so threads already
+    spread encodes over the cores; the shared semaphore only keeps bursts of
+    guild updates from queueing more encodes than there are cores to run them.
+    """
+    async with _encode_semaphore:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def optimize_png(buffer: BytesIO) -> BytesIO:
+    """Losslessly recompress a PNG with oxipng in a worker thread, if enabled and installed."""
+    if oxipng is None or not bot_config.map_oxipng_enabled:
+        return buffer
+    optimized = await run_encode(oxipng.optimize_from_memory, buffer.getvalue())
+    return BytesIO(optimized)
+
+
+class MercatorProjection:
+    """Web Mercator lat/lng -> pixel projection for a fixed bounding box and image size.
+
+    Calling the instance projects a single point; project_many() projects whole
+    coordinate arrays in one NumPy pass.
+    """
+
+    __slots__ = ('minx', 'miny', 'maxx', 'maxy', 'width', 'height',
+                 'y_min', 'y_max', 'y_range', '_x_scale', '_y_scale')
+
+    # Degree factor of the Mercator y formula: tan((90 + lat) * pi / 360)
+    _HALF_DEG = math.pi / 360
+
+    def __init__(self, minx: float, miny: float, maxx: float, maxy: float, width: int, height: int):
+        self.minx, self.miny, self.maxx, self.maxy = minx, miny, maxx, maxy
+        self.width, self.height = width, height
+        self.y_min = self._merc_y(miny)
+        self.y_max = self._merc_y(maxy)
+        self.y_range = self.y_max - self.y_min
+        # Bounds and size are fixed per instance, so the divisions are done once here
+        self._x_scale = width / (maxx - minx)
+        self._y_scale = height / self.y_range if self.y_range else 0.0
+
+    @staticmethod
+    def _merc_y(lat):
+        return math.log(math.tan((90 + lat) * MercatorProjection._HALF_DEG))
+
+    def __call__(self, lat, lon) -> Tuple[int, int]:
+        x = (lon - self.minx) * self._x_scale
+        y = (self.y_max - math.log(math.tan((90 + lat) * self._HALF_DEG))) * self._y_scale
+        return (int(x), int(y))
+
+    def project_many(self, lats, lons) -> Tuple[np.ndarray, np.ndarray]:
+        """Project arrays of latitudes/longitudes, truncating to int like __call__."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        xs = (lons - self.minx) * self._x_scale
+        ys = (self.y_max - np.log(np.tan((90 + lats) * self._HALF_DEG))) * self._y_scale
+        return xs.astype(np.int64), ys.astype(np.int64)
 
 
 class ShapefileRenderer:
@@ -20,35 +173,100 @@ class ShapefileRenderer:
         self.log = logger
     
     def load_shapefiles(self, base_path: Path, required_files: List[str] = None) -> Dict:
-        """Load required shapefiles."""
+        """Load required shapefiles from the process-wide layer cache."""
         if required_files is None:
             required_files = ['land', 'lakes', 'rivers', 'world', 'states']
         
         shapefiles = {}
-        file_mapping = {
-            'land': 'ne_10m_land.shp',
-            'lakes': 'ne_10m_lakes.shp', 
-            'rivers': 'ne_10m_rivers_lake_centerlines.shp',
-            'world': 'ne_10m_admin_0_countries.shp',
-            'states': 'ne_10m_admin_1_states_provinces.shp'
-        }
-        
         for key in required_files:
-            if key in file_mapping:
-                filepath = base_path / file_mapping[key]
+            if key in LAYER_FILES:
                 try:
-                    if filepath.exists():
-                        shapefiles[key] = gpd.read_file(filepath)
-                        self.log.debug(f"Loaded {key}: {len(shapefiles[key])} features")
-                    else:
-                        self.log.warning(f"Shapefile not found: {filepath}")
-                        shapefiles[key] = None
+                    shapefiles[key] = load_layer(key, base_path)
                 except Exception as e:
                     self.log.error(f"Error loading {key}: {e}")
                     shapefiles[key] = None
         
         return shapefiles
     
+    @staticmethod
+    def project_coords(projection_func: Callable, coords) -> list:
+        """Project a coordinate sequence of (lon, lat) to a flat [x0, y0, x1, y1, ...] list.
+
+        Projections offering project_many() handle the whole ring in one NumPy
+        pass; plain callables are applied point by point.
+        """
+        if hasattr(projection_func, 'project_many'):
+            arr = np.asarray(coords, dtype=np.float64)
+            if arr.ndim != 2 or not len(arr):
+                return []
+            xs, ys = projection_func.project_many(arr[:, 1], arr[:, 0])
+            return np.column_stack((xs, ys)).ravel().tolist()
+        return [v for x, y in coords for v in projection_func(y, x)]
+
+    def project_layer(self, projection_func: Callable, geometries,
+                      clip_bounds: Tuple[float, float, float, float] = None) -> Optional[List[list]]:
+        """Project every part of a GeoSeries in a single NumPy pass.
+
+        Polygons contribute their exterior ring, lines their own coordinates.
+        All vertices are pulled out as one contiguous array, projected at once
+        and split back into flat x/y lists in drawing order. With
+        ``clip_bounds`` the exterior rings are first cut down to that
+        rectangle, which must lie outside the canvas; only usable for filled
+        polygons, since the cut adds edges along the rectangle. Returns None
+        when the projection or input does not support this, so the caller can
+        fall back to drawing feature by feature.
+        """
+        if not hasattr(projection_func, 'project_many') or not hasattr(geometries, 'array'):
+            return None
+        try:
+            parts = shapely.get_parts(np.asarray(geometries.array))
+            if clip_bounds is not None:
+                # Holes are never drawn, so clip the filled outlines rather than the polygons
+                outlines = shapely.polygons(shapely.get_exterior_ring(parts))
+                parts = shapely.get_parts(shapely.clip_by_rect(outlines, *clip_bounds))
+            rings = parts.copy()
+            polygons = shapely.get_type_id(parts) == 3
+            rings[polygons] = shapely.get_exterior_ring(parts[polygons])
+            coords, index = shapely.get_coordinates(rings, return_index=True)
+            xs, ys = projection_func.project_many(coords[:, 1], coords[:, 0])
+        except Exception as e:
+            self.log.debug(f"Batch projection failed, drawing feature by feature: {e}")
+            return None
+
+        # One conversion for the whole layer; slicing Python lists per ring is
+        # cheaper than creating and converting an array view for each of them
+        flat = np.column_stack((xs, ys)).ravel().tolist()
+        ends = np.cumsum(np.bincount(index, minlength=len(rings))).tolist()
+        return [flat[2 * start:2 * end] for start, end in zip([0] + ends[:-1], ends)]
+
+    def select_intersecting(self, geometries, area, keep_on_error: bool = False):
+        """Return the geometries intersecting ``area``, in their original order.
+
+        GeoSeries are queried through their spatial index (built by GeoPandas
+        on first use and kept with the cached layer), so only features near
+        the map are touched. Other iterables, or a failing index query, fall
+        back to testing each feature; ``keep_on_error`` keeps features whose
+        test raises.
+        """
+        sindex = getattr(geometries, 'sindex', None)
+        if sindex is not None:
+            try:
+                return geometries.iloc[np.sort(sindex.query(area, predicate="intersects"))]
+            except Exception as e:
+                self.log.debug(f"Spatial index query failed, testing every feature: {e}")
+
+        selected = []
+        for geom in geometries:
+            if geom is None:
+                continue
+            try:
+                if geom.intersects(area):
+                    selected.append(geom)
+            except Exception:
+                if keep_on_error:
+                    selected.append(geom)
+        return selected
+
     def draw_polygons(self, draw: ImageDraw.Draw, geometries, projection_func: Callable, 
                      bbox, fill_color: tuple, outline_color: tuple = None, width: int = 0):
         """Draw polygon geometries."""
@@ -56,14 +274,30 @@ class ShapefileRenderer:
             return
             
         drawn_count = 0
-        for poly in geometries:
-            if poly is None or not poly.intersects(bbox):
+        selected = self.select_intersecting(geometries, bbox)
+        # Continent outlines reach far past the map, and PIL's fill cost grows
+        # with the edge count, so cut them to a margin around the view first
+        minx, miny, maxx, maxy = bbox.bounds
+        margin = max(maxx - minx, maxy - miny) * POLYGON_CLIP_MARGIN
+        clip_bounds = (minx - margin, max(miny - margin, -90.0), maxx + margin, min(maxy + margin, 90.0))
+        rings = self.project_layer(projection_func, selected, clip_bounds)
+        if rings is not None:
+            for pts in rings:
+                # Flat x/y list, so at least three points
+                if len(pts) >= 6:
+                    draw.polygon(pts, fill=fill_color, outline=outline_color, width=width)
+                    drawn_count += 1
+            self.log.debug(f"Drew {drawn_count} polygons")
+            return
+
+        for poly in selected:
+            if poly is None:
                 continue
             for ring in getattr(poly, "geoms", [poly]):
                 try:
                     if hasattr(ring, 'exterior'):
-                        pts = [projection_func(y, x) for x, y in ring.exterior.coords]
-                        if len(pts) >= 3:
+                        pts = self.project_coords(projection_func, ring.exterior.coords)
+                        if len(pts) >= 6:
                             draw.polygon(pts, fill=fill_color, outline=outline_color, width=width)
                             drawn_count += 1
                 except Exception as e:
@@ -79,49 +313,46 @@ class ShapefileRenderer:
             return
             
         drawn_count = 0
-        intersect_count = 0
         total_count = len(geometries)
         
-        for line in geometries:
+        if feature_name in ["countries", "states"]:
+            buffer_size = 2.0
+        else:
+            buffer_size = 0.1
+        # Borders are kept even if the intersection test fails on them
+        candidates = self.select_intersecting(geometries, bbox.buffer(buffer_size),
+                                              keep_on_error=feature_name in ["countries", "states"])
+
+        rings = self.project_layer(projection_func, candidates)
+        if rings is not None:
+            for pts in rings:
+                if len(pts) >= 4:
+                    draw.line(pts, fill=color, width=width)
+                    drawn_count += 1
+            self.log.info(f"Drew {drawn_count} {feature_name} from {total_count} total")
+            return
+
+        for line in candidates:
             if line is None:
                 continue
                 
-            try:
-                if feature_name in ["countries", "states"]:
-                    buffer_size = 2.0
-                else:
-                    buffer_size = 0.1
-                
-                intersects = line.intersects(bbox.buffer(buffer_size))
-                if not intersects:
-                    continue
-                else:
-                    intersect_count += 1
-                    
-            except Exception as e:
-                self.log.debug(f"Intersection error for {feature_name}: {e}")
-                if feature_name in ["countries", "states"]:
-                    intersect_count += 1
-                else:
-                    continue
-                
             if feature_name in ["countries", "states"]:
                 try:
                     if hasattr(line, 'exterior'):
-                        pts = [projection_func(y, x) for x, y in line.exterior.coords]
-                        if len(pts) >= 2:
+                        pts = self.project_coords(projection_func, line.exterior.coords)
+                        if len(pts) >= 4:
                             draw.line(pts, fill=color, width=width)
                             drawn_count += 1
                     elif hasattr(line, 'geoms'):
                         for poly in line.geoms:
                             if hasattr(poly, 'exterior'):
-                                pts = [projection_func(y, x) for x, y in poly.exterior.coords]
-                                if len(pts) >= 2:
+                                pts = self.project_coords(projection_func, poly.exterior.coords)
+                                if len(pts) >= 4:
                                     draw.line(pts, fill=color, width=width)
                                     drawn_count += 1
                     elif hasattr(line, 'coords'):
-                        pts = [projection_func(y, x) for x, y in line.coords]
-                        if len(pts) >= 2:
+                        pts = self.project_coords(projection_func, line.coords)
+                        if len(pts) >= 4:
                             draw.line(pts, fill=color, width=width)
                             drawn_count += 1
                 except Exception as e:
@@ -131,13 +362,13 @@ class ShapefileRenderer:
             for seg in getattr(line, "geoms", [line]):
                 try:
                     if hasattr(seg, 'coords'):
-                        pts = [projection_func(y, x) for x, y in seg.coords]
-                        if len(pts) >= 2:
+                        pts = self.project_coords(projection_func, seg.coords)
+                        if len(pts) >= 4:
                             draw.line(pts, fill=color, width=width)
                             drawn_count += 1
                     elif hasattr(seg, 'exterior'):
-                        pts = [projection_func(y, x) for x, y in seg.exterior.coords]
-                        if len(pts) >= 2:
+                        pts = self.project_coords(projection_func, seg.exterior.coords)
+                        if len(pts) >= 4:
                             draw.line(pts, fill=color, width=width)
                             drawn_count += 1
                 except Exception as e:
@@ -158,6 +389,13 @@ class MapGenerator:
         self.renderer = ShapefileRenderer(logger)
         self.base_image_width = 3000
         self.map_configs = self.map_config.MAP_REGIONS
+        self._projections: Dict[Tuple[str, int, int], Callable] = {}
+        self._bounds_arrays: Dict[str, np.ndarray] = {}
+        self._dimensions: Dict[str, Tuple[int, int]] = {}
+        # Transparent pin layers kept between renders, one per image size;
+        # pins are drawn in worker threads, hence the lock
+        self._pin_layers: Dict[Tuple[int, int], Image.Image] = {}
+        self._pin_layers_lock = threading.Lock()
 
     def _ensure_color_tuple(self, color_value, default_tuple: tuple) -> tuple:
         """Ensure color value is a valid RGB tuple."""
@@ -246,7 +484,13 @@ class MapGenerator:
         return pin_color, pin_size
 
     def calculate_image_dimensions(self, region: str) -> Tuple[int, int]:
-        """Calculate image dimensions based on region bounds."""
+        """Calculate image dimensions based on region bounds, once per region."""
+        dimensions = self._dimensions.get(region)
+        if dimensions is None:
+            dimensions = self._dimensions[region] = self._compute_image_dimensions(region)
+        return dimensions
+
+    def _compute_image_dimensions(self, region: str) -> Tuple[int, int]:
         # Use the new method that checks shapefile bounds first
         data_path = Path(__file__).parent.parent / "cogs/map_data"
         bounds = self.map_config.get_region_bounds(region, data_path)
@@ -279,18 +523,48 @@ class MapGenerator:
                 return (int(x), int(y))
             return to_px_eq
 
-        def _merc_y(lat):
-            return math.log(math.tan((90 + lat) * math.pi / 360))
+        return MercatorProjection(minx, miny, maxx, maxy, width, height)
+
+    def get_render_bounds(self, region: str) -> Tuple[float, float, float, float]:
+        """Get (minx, miny, maxx, maxy) a region's base map is rendered with."""
+        data_path = Path(__file__).parent.parent / "cogs/map_data"
+        (lat0, lon0), (lat1, lon1) = self.map_config.get_region_bounds(region, data_path)
+        minx, miny, maxx, maxy = lon0, lat0, lon1, lat1
+        
+        if region == "germany":
+            try:
+                de_bounds = germany_bounds()
+                if de_bounds:
+                    minx, miny, maxx, maxy = de_bounds
+            except Exception as e:
+                self.log.warning(f"Could not get Germany bounds: {e}")
+        
+        return minx, miny, maxx, maxy
 
-        y_min = _merc_y(miny)
-        y_max = _merc_y(maxy)
-        y_range = y_max - y_min
+    def get_region_bounds_array(self, region: str) -> np.ndarray:
+        """Get a region's [[lat_min, lng_min], [lat_max, lng_max]] bounds as a cached array."""
+        bounds = self._bounds_arrays.get(region)
+        if bounds is None:
+            data_path = Path(__file__).parent.parent / "cogs/map_data"
+            bounds = np.array(self.map_config.get_region_bounds(region, data_path), dtype=np.float64)
+            self._bounds_arrays[region] = bounds
+        return bounds
+
+    def region_contains(self, region: str, lat: float, lng: float) -> bool:
+        """Check whether a coordinate lies inside a region's bounds."""
+        lo, hi = self.get_region_bounds_array(region)
+        point = np.array([lat, lng])
+        return bool(np.all((point >= lo) & (point <= hi)))
 
-        def to_px(lat, lon):
-            x = (lon - minx) / (maxx - minx) * width
-            y = (y_max - _merc_y(lat)) / y_range * height if y_range else 0
-            return (int(x), int(y))
-        return to_px
+    def get_region_projection(self, region: str, width: int, height: int) -> Callable:
+        """Get the projection function for a region's base map, cached per (region, width, height)."""
+        key = (region, width, height)
+        projection_func = self._projections.get(key)
+        if projection_func is None:
+            minx, miny, maxx, maxy = self.get_render_bounds(region)
+            projection_func = self.create_projection_function(minx, miny, maxx, maxy, width, height)
+            self._projections[key] = projection_func
+        return projection_func
 
     def get_line_widths_for_zoom(self, width: int, map_type: str, zoom_level: str = "normal", 
                                 region: str = None, custom_bounds: Tuple[float, float, float, float] = None) -> Tuple[int, int, int]:
@@ -359,7 +633,7 @@ class MapGenerator:
                 await progress_callback("Loading geographic data...", 15)
             
             base_path = Path(__file__).parent.parent / "cogs/map_data"
-            shapefiles = self.renderer.load_shapefiles(base_path, required_files)
+            shapefiles = await asyncio.to_thread(self.renderer.load_shapefiles, base_path, required_files)
             
             bbox = box(minx, miny, maxx, maxy)
             projection_func = self.create_projection_function(minx, miny, maxx, maxy, width, height)
@@ -367,21 +641,22 @@ class MapGenerator:
             if progress_callback:
                 await progress_callback("Creating base canvas...", 25)
             
-            img = Image.new("RGB", (width, height), water_color)
+            # Layers are drawn onto a palette canvas: one byte per pixel instead
+            # of three, and ImageDraw maps the RGB fills to palette entries
+            img = Image.new("P", (width, height), water_color)
             draw = ImageDraw.Draw(img)
+            # Each layer is drawn in a worker thread so the event loop keeps
+            # serving other guilds; the awaits keep the layers in order
             
             if shapefiles['land'] is not None:
                 if progress_callback:
                     await progress_callback("Drawing land masses...", 40)
-                self.renderer.draw_polygons(draw, shapefiles['land'].geometry, projection_func, bbox, land_color)
+                await asyncio.to_thread(self.renderer.draw_polygons, draw, shapefiles['land'].geometry, projection_func, bbox, land_color)
                 
                 # Send intermediate image after land drawing
                 if progress_callback:
                     try:
-                        intermediate_img = img.copy()
-                        img_buffer = BytesIO()
-                        intermediate_img.save(img_buffer, format='PNG', optimize=True)
-                        img_buffer.seek(0)
+                        img_buffer = await asyncio.to_thread(encode_png, img, compress_level=1, palette=False)
                         await progress_callback("Land masses drawn, adding water bodies...", 45, img_buffer)
                     except Exception as e:
                         await progress_callback("Land masses drawn, adding water bodies...", 45)
@@ -389,15 +664,12 @@ class MapGenerator:
             if shapefiles['lakes'] is not None:
                 if progress_callback:
                     await progress_callback("Drawing lakes and water bodies...", 55)
-                self.renderer.draw_polygons(draw, shapefiles['lakes'].geometry, projection_func, bbox, water_color)
+                await asyncio.to_thread(self.renderer.draw_polygons, draw, shapefiles['lakes'].geometry, projection_func, bbox, water_color)
                 
                 # Send intermediate image after lakes drawing
                 if progress_callback:
                     try:
-                        intermediate_img = img.copy()
-                        img_buffer = BytesIO()
-                        intermediate_img.save(img_buffer, format='PNG', optimize=True)
-                        img_buffer.seek(0)
+                        img_buffer = await asyncio.to_thread(encode_png, img, compress_level=1, palette=False)
                         await progress_callback("Water bodies drawn, adding borders...", 60, img_buffer)
                     except Exception as e:
                         await progress_callback("Water bodies drawn, adding borders...", 60)
@@ -418,28 +690,25 @@ class MapGenerator:
             if map_type != "world" and shapefiles.get('rivers') is not None:
                 if progress_callback:
                     await progress_callback("Drawing rivers and waterways...", 70)
-                self.renderer.draw_lines(draw, shapefiles['rivers'].geometry, projection_func, bbox, river_color, river_width, "rivers")
+                await asyncio.to_thread(self.renderer.draw_lines, draw, shapefiles['rivers'].geometry, projection_func, bbox, river_color, river_width, "rivers")
             
             # Draw state/province borders only for detailed maps (not continents or world)
             continent_map_types = ["world", "europe", "asia", "africa", "northamerica", "southamerica", "australia"]
             if map_type not in continent_map_types and shapefiles.get('states') is not None:
                 if progress_callback:
                     await progress_callback("Drawing state/province borders...", 85)
-                self.renderer.draw_lines(draw, shapefiles['states'].geometry, projection_func, bbox, state_color, state_width, "states")
+                await asyncio.to_thread(self.renderer.draw_lines, draw, shapefiles['states'].geometry, projection_func, bbox, state_color, state_width, "states")
             
             # Draw country borders (admin_0 = international boundaries)
             if shapefiles.get('world') is not None:
                 if progress_callback:
                     await progress_callback("Drawing country borders...", 95)
-                self.renderer.draw_lines(draw, shapefiles['world'].geometry, projection_func, bbox, country_color, country_width, "countries")
+                await asyncio.to_thread(self.renderer.draw_lines, draw, shapefiles['world'].geometry, projection_func, bbox, country_color, country_width, "countries")
                 
                 # Send final base map image before completion
                 if progress_callback:
                     try:
-                        intermediate_img = img.copy()
-                        img_buffer = BytesIO()
-                        intermediate_img.save(img_buffer, format='PNG', optimize=True)
-                        img_buffer.seek(0)
+                        img_buffer = await asyncio.to_thread(encode_png, img, compress_level=1, palette=False)
                         await progress_callback("Base map complete, finalizing...", 98, img_buffer)
                     except Exception as e:
                         await progress_callback("Base map complete, finalizing...", 98)
@@ -447,7 +716,7 @@ class MapGenerator:
             if progress_callback:
                 await progress_callback("Finalizing map rendering...", 100)
             
-            return img, projection_func
+            return img.convert("RGB"), projection_func
             
         except Exception as e:
             self.log.error(f"Failed to render base map: {e}")
@@ -459,24 +728,7 @@ class MapGenerator:
     async def render_geopandas_map(self, region: str, width: int, height: int, guild_id: str = None, maps: Dict = None, progress_callback=None) -> Tuple[Image.Image, Callable]:
         """Render map for predefined regions with geographic scaling."""
         try:
-            # Use the new method that checks shapefile bounds first
-            data_path = Path(__file__).parent.parent / "cogs/map_data"
-            bounds = self.map_config.get_region_bounds(region, data_path)
-            (lat0, lon0), (lat1, lon1) = bounds
-            minx, miny, maxx, maxy = lon0, lat0, lon1, lat1
-            
-            if region == "germany":
-                try:
-                    base_path = Path(__file__).parent.parent / "cogs/map_data"
-                    world = gpd.read_file(base_path / "ne_10m_admin_0_countries.shp")
-                    de = world[world["ADMIN"] == "Germany"].geometry.unary_union
-                    if de is not None:
-                        de_buf = de.buffer(0.1)
-                        bounds = de_buf.bounds
-                        if all(math.isfinite(v) for v in bounds) and bounds[2] > bounds[0] and bounds[3] > bounds[1]:
-                            minx, miny, maxx, maxy = bounds
-                except Exception as e:
-                    self.log.warning(f"Could not get Germany bounds: {e}")
+            minx, miny, maxx, maxy = self.get_render_bounds(region)
             
             map_type = "world" if region == "world" else "europe" if region == "europe" else "default"
             
@@ -493,25 +745,59 @@ class MapGenerator:
         # Pass custom bounds for geographic scale calculation
         return await self.render_base_map(minx, miny, maxx, maxy, width, height, "proximity", guild_id, maps, "proximity", region=None, progress_callback=progress_callback)
 
-    def group_overlapping_pins(self, pins: Dict, projection_func: Callable, base_pin_size: int) -> List[Dict]:
-        """Group overlapping pins together."""
+    def group_overlapping_pins(self, pins: Dict, projection_func: Callable, base_pin_size: int,
+                               arrays: Optional[Dict[str, np.ndarray]] = None) -> List[Dict]:
+        """Group overlapping pins together.
+
+        ``arrays`` is an optional columnar copy of ``pins`` ('user_ids', 'lat', 'lng')
+        which saves rebuilding the coordinate arrays on every render.
+        """
         if not pins:
             return []
         
-        pin_positions = []
-        for user_id, pin_data in pins.items():
-            lat, lng = pin_data['lat'], pin_data['lng']
-            x, y = projection_func(lat, lng)
-            pin_positions.append({
-                'user_id': user_id,
-                'position': (x, y),
-                'data': pin_data
-            })
+        if arrays is not None:
+            items = [(user_id, pins[user_id]) for user_id in arrays['user_ids']]
+        else:
+            items = list(pins.items())
+        if hasattr(projection_func, 'project_many'):
+            # Project every pin in one vectorized pass
+            if arrays is not None:
+                lats, lngs = arrays['lat'], arrays['lng']
+            else:
+                lats = np.fromiter((pin_data['lat'] for _, pin_data in items), dtype=np.float64, count=len(items))
+                lngs = np.fromiter((pin_data['lng'] for _, pin_data in items), dtype=np.float64, count=len(items))
+            xs, ys = projection_func.project_many(lats, lngs)
+            # Pins far off the image, left over from a region change, can neither be
+            # drawn nor reach a visible group, so they skip the Python-level grouping
+            margin = base_pin_size * 2 * PIN_CULL_MARGIN
+            visible = ((xs >= -margin) & (xs < projection_func.width + margin) &
+                       (ys >= -margin) & (ys < projection_func.height + margin))
+            if not visible.all():
+                keep = np.flatnonzero(visible)
+                items = [items[i] for i in keep.tolist()]
+                xs, ys = xs[keep], ys[keep]
+            positions = zip(xs.tolist(), ys.tolist())
+        else:
+            positions = (projection_func(pin_data['lat'], pin_data['lng']) for _, pin_data in items)
+        
+        pin_positions = [
+            {'user_id': user_id, 'position': position, 'data': pin_data}
+            for (user_id, pin_data), position in zip(items, positions)
+        ]
         
         groups = []
         used_pins = set()
         overlap_threshold = base_pin_size * 2
         
+        # Bucket pins into grid cells one threshold wide: anything that can
+        # overlap a pin sits in its own or one of the eight neighbouring cells,
+        # which keeps grouping near-linear instead of comparing every pair
+        cell_size = max(overlap_threshold, 1)
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for index, pin in enumerate(pin_positions):
+            x, y = pin['position']
+            cells.setdefault((x // cell_size, y // cell_size), []).append(index)
+        
         for i, pin in enumerate(pin_positions):
             if i in used_pins:
                 continue
@@ -523,9 +809,15 @@ class MapGenerator:
             }
             used_pins.add(i)
             
-            for j, other_pin in enumerate(pin_positions):
-                if j in used_pins or j == i:
+            cx, cy = pin['position'][0] // cell_size, pin['position'][1] // cell_size
+            neighbours = sorted(
+                j for nx in (cx - 1, cx, cx + 1) for ny in (cy - 1, cy, cy + 1)
+                for j in cells.get((nx, ny), ())
+            )
+            for j in neighbours:
+                if j in used_pins:
                     continue
+                other_pin = pin_positions[j]
                 
                 dx = pin['position'][0] - other_pin['position'][0]
                 dy = pin['position'][1] - other_pin['position'][1]
@@ -546,8 +838,59 @@ class MapGenerator:
         return groups
 
     def draw_pins_on_map(self, image: Image.Image, pin_groups: List[Dict], width: int, height: int, base_pin_size: int, guild_id: str = None, maps: Dict = None):
-        """Draw pin groups on the map."""
-        draw = ImageDraw.Draw(image)
+        """Draw pin groups on the map by compositing a transparent pin layer over it.
+
+        Pins spread over the whole map but cover little of it, so the layer is
+        blended tile by tile, and only in the tiles the drawn pins touch.
+        """
+        with self._pin_layers_lock:
+            layer = self._pin_layers.pop((width, height), None)
+        extents = []
+        layer = self.render_pin_layer(pin_groups, width, height, base_pin_size, guild_id, maps,
+                                      layer=layer, extents=extents)
+        tiles = set()
+        for x0, y0, x1, y1 in extents:
+            tiles.update(
+                (tx, ty)
+                for tx in range(max(x0, 0) // PIN_TILE_SIZE, (min(x1, width) - 1) // PIN_TILE_SIZE + 1)
+                for ty in range(max(y0, 0) // PIN_TILE_SIZE, (min(y1, height) - 1) // PIN_TILE_SIZE + 1)
+            )
+        # Merge horizontal runs of touched tiles so each run is blended in one call
+        boxes = []
+        for ty, tx in sorted((ty, tx) for tx, ty in tiles):
+            x0, y0 = tx * PIN_TILE_SIZE, ty * PIN_TILE_SIZE
+            x1, y1 = min(x0 + PIN_TILE_SIZE, width), min(y0 + PIN_TILE_SIZE, height)
+            if boxes and boxes[-1][1] == y0 and boxes[-1][2] == x0:
+                boxes[-1] = (boxes[-1][0], y0, x1, y1)
+            else:
+                boxes.append((x0, y0, x1, y1))
+        if boxes:
+            bbox = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                    max(b[2] for b in boxes), max(b[3] for b in boxes))
+            # Once pins touch over a quarter of their bounding box, one blend beats many
+            if 4 * len(tiles) * PIN_TILE_SIZE ** 2 > (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]):
+                boxes = [bbox]
+        for box in boxes:
+            tile = layer.crop(box)
+            image.paste(tile, box[:2], tile)
+            # Wipe the blended area so the layer can be reused fully transparent
+            layer.paste((0, 0, 0, 0), box)
+
+        with self._pin_layers_lock:
+            self._pin_layers[(width, height)] = layer
+            if len(self._pin_layers) > PIN_LAYER_POOL_SIZE:
+                del self._pin_layers[next(iter(self._pin_layers))]
+
+    def render_pin_layer(self, pin_groups: List[Dict], width: int, height: int, base_pin_size: int, guild_id: str = None, maps: Dict = None,
+                         layer: Image.Image = None, extents: List = None) -> Image.Image:
+        """Render pin groups onto a transparent RGBA layer the size of the map.
+
+        An existing, fully transparent ``layer`` is drawn on instead of allocating one.
+        If ``extents`` is given, the (x0, y0, x1, y1) box of every drawn pin is appended to it.
+        """
+        if layer is None:
+            layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
         
         if guild_id and maps:
             pin_color, custom_pin_size = self.get_pin_settings(guild_id, maps)
@@ -565,23 +908,24 @@ class MapGenerator:
             pin_size = base_pin_size + (count - 1) * 3
             
             shadow_offset = 2
+            # Opaque: drawn straight onto the RGB map, the old '#00000080' lost its alpha
             draw.ellipse([
                 x - pin_size + shadow_offset,
                 y - pin_size + shadow_offset,
                 x + pin_size + shadow_offset,
                 y + pin_size + shadow_offset
-            ], fill='#00000080')
+            ], fill='#000000')
             
             draw.ellipse([x - pin_size, y - pin_size, x + pin_size, y + pin_size],
                        fill=pin_color, outline='white', width=2)
+            if extents is not None:
+                # Circle plus shadow, with a pixel to spare for antialiasing
+                extents.append((x - pin_size - 1, y - pin_size - 1,
+                                x + pin_size + shadow_offset + 2, y + pin_size + shadow_offset + 2))
             
             if count > 1:
                 try:
-                    try:
-                        font = ImageFont.truetype("arial.ttf", pin_size)
-                    except:
-                        font = ImageFont.load_default()
-                    
+                    font = count_font(pin_size)
                     text = str(count)
                     bbox = draw.textbbox((0, 0), text, font=font)
                     text_width = bbox[2] - bbox[0]
@@ -589,8 +933,14 @@ class MapGenerator:
                     text_x = x - text_width // 2
                     text_y = y - text_height // 2
                     draw.text((text_x, text_y), text, fill='white', font=font)
+                    if extents is not None:
+                        extents.append((text_x + bbox[0], text_y + bbox[1], text_x + bbox[2], text_y + bbox[3]))
                 except:
                     draw.text((x-5, y-5), str(count), fill='white')
+                    if extents is not None:
+                        extents.append(draw.textbbox((x - 5, y - 5), str(count)))
+        
+        return layer
 
     async def geocode_location(self, location: str) -> Optional[Tuple[float, float, str, Optional[str]]]:
         """Geocode a location string to coordinates."""
@@ -606,16 +956,17 @@ class MapGenerator:
                 'User-Agent': 'DiscordBot-MapPins/2.0'
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data:
-                            lat = float(data[0]['lat'])
-                            lng = float(data[0]['lon'])
-                            display_name = data[0].get('display_name', location)
-                            country_code = data[0].get('address', {}).get('country_code')
-                            return (lat, lng, display_name, country_code)
+            # Shared pooled session keeps the Nominatim connection alive between lookups
+            session = await http_client.get_session()
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data:
+                        lat = float(data[0]['lat'])
+                        lng = float(data[0]['lon'])
+                        display_name = data[0].get('display_name', location)
+                        country_code = data[0].get('address', {}).get('country_code')
+                        return (lat, lng, display_name, country_code)
 
             return None
             
@@ -623,6 +974,15 @@ class MapGenerator:
             self.log.error(f"Geocoding failed for '{location}': {e}")
             return None
 
+    def within_radius(self, lats_rad: np.ndarray, lngs_rad: np.ndarray, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """Vectorized Haversine test: mask of points (given in radians) within radius_km of (lat, lng)."""
+        R = 6371
+        lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+        a = (np.sin((lats_rad - lat_rad) / 2) ** 2 +
+             math.cos(lat_rad) * np.cos(lats_rad) * np.sin((lngs_rad - lng_rad) / 2) ** 2)
+        # Compare in haversine space instead of taking arcsin per point
+        return a <= math.sin(min(radius_km / R, math.pi) / 2) ** 2
+
     def calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """Calculate distance between two points using Haversine formula."""
         R = 6371
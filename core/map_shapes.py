@@ -0,0 +1,164 @@
+"""Process-wide cache for the Natural Earth layers used by the map renderer."""
+
+import json
+import logging
+import math
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import geopandas as gpd
+
+log = logging.getLogger("tausendsassa.map_shapes")
+
+DATA_DIR = Path(__file__).parent.parent / "cogs/map_data"
+REGION_BOUNDS_FILE = DATA_DIR / "region_bounds.json"
+GERMANY_BUFFER = 0.1
+
+LAYER_FILES = {
+    'land': 'ne_10m_land.shp',
+    'lakes': 'ne_10m_lakes.shp',
+    'rivers': 'ne_10m_rivers_lake_centerlines.shp',
+    'world': 'ne_10m_admin_0_countries.shp',
+    'states': 'ne_10m_admin_1_states_provinces.shp'
+}
+
+
+def load_layer(key: str, base_path: Path = DATA_DIR) -> Optional[gpd.GeoDataFrame]:
+    """Load a Natural Earth layer once and keep it for the lifetime of the process.
+
+    A GeoParquet copy next to the shapefile is preferred when present and
+    not older than the shapefile; otherwise one is written after parsing it.
+    The returned frame is shared between callers and must be treated as read-only.
+    Returns None if the layer is unknown or missing on disk.
+    """
+    return _load_layer(key, str(Path(base_path).resolve()))
+
+
+@lru_cache(maxsize=None)
+def _load_layer(key: str, base_path: str) -> Optional[gpd.GeoDataFrame]:
+    filename = LAYER_FILES.get(key)
+    if filename is None:
+        return None
+
+    filepath = Path(base_path) / filename
+    parquet_path = filepath.with_suffix('.parquet')
+    if parquet_path.exists() and not _is_stale(parquet_path, filepath):
+        # Written by scripts/shp_to_parquet.py or a previous start, skips GDAL entirely
+        frame = gpd.read_parquet(parquet_path)
+    elif filepath.exists():
+        frame = gpd.read_file(filepath)
+        _write_parquet(frame, parquet_path)
+    else:
+        log.warning(f"Shapefile not found: {filepath}")
+        return None
+
+    log.debug(f"Loaded {key}: {len(frame)} features")
+    return frame
+
+
+def _is_stale(parquet_path: Path, shapefile: Path) -> bool:
+    """True if the shapefile was updated after its GeoParquet copy was written."""
+    return shapefile.exists() and shapefile.stat().st_mtime > parquet_path.stat().st_mtime
+
+
+def _write_parquet(frame: gpd.GeoDataFrame, parquet_path: Path) -> None:
+    """Keep a GeoParquet copy so later starts skip the shapefile parse."""
+    try:
+        frame.to_parquet(parquet_path, compression="zstd")
+        log.info(f"Wrote {parquet_path.name}")
+    except Exception as e:
+        log.warning(f"Could not write {parquet_path.name}: {e}")
+
+
+@lru_cache(maxsize=None)
+def precomputed_bounds() -> Dict[str, list]:
+    """Bounds written by scripts/build_region_bounds.py, or {} if the sidecar is missing."""
+    try:
+        return json.loads(REGION_BOUNDS_FILE.read_text())
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log.warning(f"Could not read {REGION_BOUNDS_FILE.name}: {e}")
+        return {}
+
+
+@lru_cache(maxsize=None)
+def germany_bounds(buffer: float = GERMANY_BUFFER) -> Optional[Tuple[float, float, float, float]]:
+    """Return (minx, miny, maxx, maxy) of Germany's outline grown by ``buffer`` degrees.
+
+    Both the base map renderer and the pin projection use these bounds, so
+    pins line up with cached base maps. The default buffer is served from
+    region_bounds.json, which avoids loading admin_0 and a GEOS union + buffer.
+    If the sidecar lacks the entry it is computed once and written back, so
+    only the first start after a data update pays for the geometry work.
+    """
+    if buffer != GERMANY_BUFFER:
+        return compute_germany_bounds(buffer)
+
+    stored = precomputed_bounds().get('germany')
+    if stored and len(stored) == 4:
+        return tuple(stored)
+
+    bounds = compute_germany_bounds(buffer)
+    if bounds is not None:
+        store_bounds('germany', bounds)
+    return bounds
+
+
+def store_bounds(key: str, bounds: Tuple[float, float, float, float]) -> None:
+    """Persist ``bounds`` under ``key`` in region_bounds.json, keeping other entries."""
+    stored = dict(precomputed_bounds())
+    stored[key] = list(bounds)
+    try:
+        REGION_BOUNDS_FILE.write_text(json.dumps(stored, indent=2) + "\n")
+    except OSError as e:
+        log.warning(f"Could not write {REGION_BOUNDS_FILE.name}: {e}")
+        return
+    precomputed_bounds.cache_clear()
+
+
+def compute_germany_bounds(buffer: float = GERMANY_BUFFER) -> Optional[Tuple[float, float, float, float]]:
+    """Compute Germany's buffered bounds from the admin_0 layer."""
+    de = country_outline("ADMIN", "Germany", largest_only=False)
+    if de is None or de.is_empty:
+        return None
+
+    bounds = de.buffer(buffer).bounds
+    if all(math.isfinite(v) for v in bounds) and bounds[2] > bounds[0] and bounds[3] > bounds[1]:
+        return tuple(bounds)
+    return None
+
+
+def name_index(key: str, column: str, base_path: Path = DATA_DIR) -> Dict[str, list]:
+    """Map each value of ``column`` to the row positions carrying it, built once per layer."""
+    return _name_index(key, column, str(Path(base_path).resolve()))
+
+
+@lru_cache(maxsize=None)
+def _name_index(key: str, column: str, base_path: str) -> Dict[str, list]:
+    frame = load_layer(key, base_path)
+    if frame is None or column not in frame.columns:
+        return {}
+    return {name: list(positions) for name, positions in frame.groupby(column).indices.items()}
+
+
+def country_outline(column: str, name: str, largest_only: bool = True, base_path: Path = DATA_DIR):
+    """Return the merged outline of the admin_0 rows where ``column == name``.
+
+    With ``largest_only`` only the biggest row is kept, which drops small
+    dependencies sharing the same name. Returns None if nothing matches.
+    """
+    return _country_outline(column, name, largest_only, str(Path(base_path).resolve()))
+
+
+@lru_cache(maxsize=None)
+def _country_outline(column: str, name: str, largest_only: bool, base_path: str):
+    positions = name_index('world', column, base_path).get(name)
+    if not positions:
+        return None
+
+    rows = load_layer('world', base_path).iloc[positions]
+    if largest_only and len(rows) > 1:
+        rows = rows.loc[[rows.geometry.area.idxmax()]]
+    return rows.geometry.unary_union
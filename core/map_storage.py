@@ -1,14 +1,71 @@
 """Map storage and caching utilities for the Discord Map Bot - Improved Cache System."""
 
-import json
+import asyncio
 import hashlib
+import shutil
 from pathlib import Path
-from typing import Dict, Optional, Tuple, Literal, Union
+from typing import Dict, List, Optional, Set, Tuple, Literal, Union
 from datetime import datetime
 from io import BytesIO
 from PIL import Image
 import discord
+import orjson
 from core.cache_manager import cache_manager
+from core.map_gen import encode_png, run_encode, to_palette
+
+
+# Base maps with default settings written by scripts/prerender_base_maps.py
+BUNDLED_BASE_MAP_DIR = "base_maps"
+
+# Bump when the hashes in cache keys change; files keyed the old way are purged once
+CACHE_KEY_VERSION = 2
+CACHE_KEY_VERSION_FILE = ".key_version"
+
+
+def bundled_base_map_name(region: str, width: int, height: int) -> str:
+    """File name of a pre-rendered default base map; matches the default base_map cache key."""
+    return f"base_map_{region}_{width}_{height}_default.png"
+
+
+def _digest(obj) -> str:
+    """Short stable hash of a JSON-serialisable object, used in cache keys."""
+    return hashlib.md5(orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)).hexdigest()[:8]
+
+
+def _read_image(path: Path) -> Image.Image:
+    """Open and fully decode an image so no file handle outlives the call.
+
+    Cached base maps are palette PNGs and stay palette images, which is how
+    they are kept in memory; get_cached_base_map() hands out RGB copies.
+    """
+    with Image.open(path) as image:
+        image.load()
+        return image if image.mode in ('P', 'RGB') else image.convert('RGB')
+
+
+def _read_bytes(path: Path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_png(path: Path, image: Image.Image):
+    _write_bytes(path, encode_png(image).getvalue())
+
+
+def _write_bytes(path: Path, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _unlink_matching(directory: Path, pattern: str) -> List[str]:
+    """Delete the files in ``directory`` matching ``pattern`` and return their names."""
+    if not directory.exists():
+        return []
+    removed = []
+    for cache_file in directory.glob(pattern):
+        cache_file.unlink(missing_ok=True)
+        removed.append(cache_file.name)
+    return removed
 
 
 class UnifiedCacheManager:
@@ -25,6 +82,61 @@ class UnifiedCacheManager:
         
         # Use global managed cache
         self.memory_cache = cache_manager.memory_cache
+        
+        # Invalidation is scoped per guild: its own lock, and only the custom
+        # base map keys it put into the shared memory cache get evicted
+        self._guild_locks: Dict[str, asyncio.Lock] = {}
+        self._guild_memory_keys: Dict[str, Set[str]] = {}
+    
+    def purge_stale_keys(self) -> int:
+        """Delete cache files written under an older CACHE_KEY_VERSION, once; blocking.
+
+        Files whose key carries a settings or pin hash would never be hit or
+        evicted again. Default base maps carry no hash and are kept.
+        """
+        marker = self.cache_dir / CACHE_KEY_VERSION_FILE
+        try:
+            if marker.read_text().strip() == str(CACHE_KEY_VERSION):
+                return 0
+        except (OSError, ValueError):
+            pass
+
+        removed = 0
+        # Guild directories only hold maps with custom settings, all hash-keyed
+        for guild_dir in self.data_dir.iterdir():
+            if guild_dir.is_dir() and guild_dir.name.isdigit():
+                removed += len(_unlink_matching(guild_dir, "*.png"))
+        for cache_file in self.cache_dir.glob("*.png"):
+            name = cache_file.name
+            # Final maps and closeups carry a pin hash even with default settings
+            if not (name.startswith(("base_map_", "closeup_base_map_")) and name.endswith("_default.png")):
+                cache_file.unlink(missing_ok=True)
+                removed += 1
+
+        try:
+            marker.write_text(f"{CACHE_KEY_VERSION}\n")
+        except OSError as e:
+            self.log.warning(f"Could not write {marker.name}: {e}")
+        return removed
+
+    def guild_lock(self, guild_id: str) -> asyncio.Lock:
+        """Lock serialising cache invalidation for one guild."""
+        # setdefault never yields to the event loop, so concurrent callers get the same lock
+        return self._guild_locks.setdefault(guild_id, asyncio.Lock())
+    
+    async def set_memory(self, guild_id: str, cache_key: str, image: Image.Image):
+        """Put a base map into the memory cache, remembering custom keys per guild."""
+        await self.memory_cache.set(cache_key, image)
+        # Default base maps are shared by every guild without custom settings
+        if not cache_key.endswith("_default"):
+            self._guild_memory_keys.setdefault(guild_id, set()).add(cache_key)
+    
+    async def evict_guild_memory(self, guild_id: str) -> int:
+        """Drop this guild's custom base maps from memory, leaving everything else cached."""
+        keys = self._guild_memory_keys.pop(guild_id, set())
+        for cache_key in keys:
+            await self.memory_cache.remove(cache_key)
+        return len(keys)
     
     def _get_guild_cache_dir(self, guild_id: str) -> Path:
         """Get guild-specific cache directory."""
@@ -72,8 +184,7 @@ class UnifiedCacheManager:
             # This allows base map reuse when only pin color/size changes
             
             if base_map_settings:
-                settings_str = json.dumps(base_map_settings, sort_keys=True)
-                settings_hash = hashlib.md5(settings_str.encode()).hexdigest()[:8]
+                settings_hash = _digest(base_map_settings)
                 base_parts.append(settings_hash)
             else:
                 base_parts.append("default")
@@ -99,8 +210,7 @@ class UnifiedCacheManager:
         if not visual_settings:
             return "default"
         
-        settings_str = json.dumps(visual_settings, sort_keys=True)
-        return hashlib.md5(settings_str.encode()).hexdigest()[:8]
+        return _digest(visual_settings)
     
     def generate_cache_key(self, cache_type: str, guild_id: str, maps: Dict, **params) -> str:
         """Generate unified cache key for any cache type."""
@@ -132,8 +242,7 @@ class UnifiedCacheManager:
                         base_map_settings['borders'] = borders
                 
                 if base_map_settings:
-                    settings_str = json.dumps(base_map_settings, sort_keys=True)
-                    settings_hash = hashlib.md5(settings_str.encode()).hexdigest()[:8]
+                    settings_hash = _digest(base_map_settings)
                     base_parts.append(settings_hash)
                 else:
                     base_parts.append("default")
@@ -144,16 +253,14 @@ class UnifiedCacheManager:
             # Add pin hash
             pins = maps.get(guild_id, {}).get('pins', {})
             pin_data = {uid: (pin['lat'], pin['lng']) for uid, pin in pins.items()}
-            pin_str = json.dumps(pin_data, sort_keys=True)
-            pin_hash = hashlib.md5(pin_str.encode()).hexdigest()[:8]
+            pin_hash = _digest(pin_data)
             base_parts.append(pin_hash)
         elif cache_type == "closeup":
             base_parts.extend([params['closeup_type'], params['closeup_name']])
             # Add pin hash for closeups too
             pins = maps.get(guild_id, {}).get('pins', {})
             pin_data = {uid: (pin['lat'], pin['lng']) for uid, pin in pins.items()}
-            pin_str = json.dumps(pin_data, sort_keys=True)
-            pin_hash = hashlib.md5(pin_str.encode()).hexdigest()[:8]
+            pin_hash = _digest(pin_data)
             base_parts.append(pin_hash)
         
         # Add settings hash for non-base-map types
@@ -181,9 +288,9 @@ class UnifiedCacheManager:
         if cache_file.exists():
             try:
                 if cache_type in ["base_map", "closeup_base_map"]:
-                    image = Image.open(cache_file)
+                    image = await asyncio.to_thread(_read_image, cache_file)
                     # Store in memory cache too
-                    await self.memory_cache.set(cache_key, image)
+                    await self.set_memory(guild_id, cache_key, image)
                     self.log.info(f"Using disk cached {cache_type} for guild {guild_id} from {cache_location}")
                     return image.copy()
                 elif cache_type == "final_map":
@@ -191,8 +298,7 @@ class UnifiedCacheManager:
                     self.log.info(f"Using cached {cache_type} for guild {guild_id} from {cache_location}")
                     return discord.File(cache_file, filename=filename)
                 elif cache_type == "closeup":
-                    with open(cache_file, 'rb') as f:
-                        image_data = f.read()
+                    image_data = await asyncio.to_thread(_read_bytes, cache_file)
                     img_buffer = BytesIO(image_data)
                     self.log.info(f"Using cached {cache_type} for guild {guild_id} from {cache_location}")
                     return img_buffer
@@ -211,14 +317,12 @@ class UnifiedCacheManager:
         try:
             if cache_type in ["base_map", "closeup_base_map"] and isinstance(item, Image.Image):
                 # Store in memory
-                await self.memory_cache.set(cache_key, item)
+                await self.set_memory(guild_id, cache_key, item)
                 # Store on disk
-                item.save(cache_file, 'PNG', optimize=True)
+                await run_encode(_write_png, cache_file, item)
             elif isinstance(item, BytesIO):
                 # Store on disk
-                item.seek(0)
-                with open(cache_file, 'wb') as f:
-                    f.write(item.read())
+                await asyncio.to_thread(_write_bytes, cache_file, item.getvalue())
             
             self.log.info(f"Cached {cache_type} for guild {guild_id} in {cache_location}")
         except Exception as e:
@@ -229,37 +333,24 @@ class UnifiedCacheManager:
         if cache_types is None:
             cache_types = ["base_map", "final_map"]
 
-        deleted_count = 0
-
-        # Only remove CUSTOM base maps from guild cache, NOT shared default cache
-        if "base_map" in cache_types:
-            # Remove from guild cache only (custom base maps)
-            guild_cache_dir = self.data_dir / guild_id
-            if guild_cache_dir.exists():
-                for cache_file in guild_cache_dir.glob("base_map_*.png"):
-                    cache_file.unlink()
-                    deleted_count += 1
-                    self.log.info(f"Removed custom base map cache file: {cache_file.name}")
-
-            # Clear memory cache for base maps (affects both custom and default)
-            await self.memory_cache.clear()
-            self.log.info("Cleared base map memory cache")
+        removed = []
+        guild_cache_dir = self.data_dir / guild_id
 
-        # Remove final maps from both shared and guild cache
-        if "final_map" in cache_types:
-            for cache_file in self.cache_dir.glob("final_map_*.png"):
-                cache_file.unlink()
-                deleted_count += 1
-                self.log.info(f"Removed shared final map cache file: {cache_file.name}")
+        async with self.guild_lock(guild_id):
+            # Only remove CUSTOM base maps from guild cache, NOT shared default cache
+            if "base_map" in cache_types:
+                removed += await asyncio.to_thread(_unlink_matching, guild_cache_dir, "base_map_*.png")
+                evicted = await self.evict_guild_memory(guild_id)
+                self.log.info(f"Evicted {evicted} custom base maps of guild {guild_id} from memory")
 
-            guild_cache_dir = self.data_dir / guild_id
-            if guild_cache_dir.exists():
-                for cache_file in guild_cache_dir.glob("final_map_*.png"):
-                    cache_file.unlink()
-                    deleted_count += 1
-                    self.log.info(f"Removed guild final map cache file: {cache_file.name}")
+            # Remove final maps from both shared and guild cache
+            if "final_map" in cache_types:
+                removed += await asyncio.to_thread(_unlink_matching, self.cache_dir, "final_map_*.png")
+                removed += await asyncio.to_thread(_unlink_matching, guild_cache_dir, "final_map_*.png")
 
-        self.log.info(f"Invalidated {cache_types} cache for guild {guild_id} ({deleted_count} files removed) - PRESERVED default base maps")
+        if removed:
+            self.log.info(f"Removed cache files: {', '.join(removed)}")
+        self.log.info(f"Invalidated {cache_types} cache for guild {guild_id} ({len(removed)} files removed) - PRESERVED default base maps")
         
     async def invalidate_all_cache_for_guild_deletion(self, guild_id: str):
         """Complete cache invalidation when a guild map is deleted - removes everything."""
@@ -287,21 +378,15 @@ class UnifiedCacheManager:
     
     async def invalidate_all_png_files_for_settings_change(self, guild_id: str):
         """Radical cleanup: remove ALL PNG files for a guild when settings are saved."""
-        deleted_count = 0
-        
-        # Remove ALL PNG files from guild cache
-        guild_cache_dir = self.data_dir / guild_id
-        if guild_cache_dir.exists():
-            for cache_file in guild_cache_dir.glob("*.png"):
-                cache_file.unlink()
-                deleted_count += 1
-                self.log.info(f"Removed guild PNG file: {cache_file.name}")
-        
-        # Clear memory cache to ensure no stale references
-        await self.memory_cache.clear()
-        self.log.info("Cleared all in-memory cache")
-        
-        self.log.info(f"Complete PNG cleanup for guild {guild_id} settings change ({deleted_count} files removed)")
+        async with self.guild_lock(guild_id):
+            # Remove ALL PNG files from guild cache
+            removed = await asyncio.to_thread(_unlink_matching, self.data_dir / guild_id, "*.png")
+            # Drop this guild's base maps from memory to ensure no stale references
+            await self.evict_guild_memory(guild_id)
+        
+        if removed:
+            self.log.info(f"Removed guild PNG files: {', '.join(removed)}")
+        self.log.info(f"Complete PNG cleanup for guild {guild_id} settings change ({len(removed)} files removed)")
     
     async def clear_all_cache(self) -> int:
         """Clear all cached items."""
@@ -337,44 +422,50 @@ class MapStorage:
         self.data_dir.mkdir(exist_ok=True)
         self.cache_dir.mkdir(exist_ok=True)
         
-        # Global overview config file
-        self.global_config_file = self.data_dir / "map_global_config.json"
-        
         # Unified cache manager
         self.cache = UnifiedCacheManager(data_dir, cache_dir, logger)
-        
-        # Legacy property for backwards compatibility - removed as it's no longer needed
-        # The new cache manager handles this internally
+        self.bundled_dir = data_dir / BUNDLED_BASE_MAP_DIR
+        # Memory cache key of the encoded map each guild last rendered
+        self._encoded_map_keys: Dict[str, str] = {}
 
     # Map data persistence lives in Postgres (db/repositories/map_repository.py);
     # the former file-based load/save methods were pre-DB legacy and are gone.
 
     # OPTIMIZED cache interface methods
     async def get_cached_base_map(self, region: str, width: int, height: int, guild_id: str = None, maps: Dict = None) -> Optional[Image.Image]:
-        """Get cached base map with improved key generation."""
+        """Get cached base map with improved key generation.
+
+        The returned image is the caller's own RGB copy and may be drawn on.
+        """
         if not guild_id or not maps:
             return None
         
         # Use specialized base map cache key
         cache_key = self.cache.generate_base_map_cache_key(guild_id, maps, region, width, height)
         
-        # Check memory cache
+        # Check memory cache - the cached image is shared, hand out an RGB copy to draw on
         cached_image = await self.cache.memory_cache.get(cache_key)
         if cached_image:
             self.log.info(f"Using in-memory cached base map for guild {guild_id}")
-            return cached_image
+            return cached_image.convert('RGB')
         
-        # Check disk cache
+        # Check pre-rendered base maps, then the disk cache
         cache_dir, cache_location = self.cache._get_cache_location(guild_id, maps)
-        cache_file = cache_dir / f"{cache_key}.png"
-        
-        if cache_file.exists():
+        candidates = [(cache_dir / f"{cache_key}.png", cache_location)]
+        if cache_key.endswith("_default"):
+            # Only pin settings (or none) are customised, so the default rendering applies
+            bundled_file = self.bundled_dir / bundled_base_map_name(region, width, height)
+            candidates.insert(0, (bundled_file, "bundled base maps"))
+        
+        for cache_file, location in candidates:
+            if not cache_file.exists():
+                continue
             try:
-                image = Image.open(cache_file)
+                image = await asyncio.to_thread(_read_image, cache_file)
                 # Store in memory cache too
-                await self.cache.memory_cache.set(cache_key, image)
-                self.log.info(f"Using disk cached base map for guild {guild_id} from {cache_location}")
-                return image.copy()
+                await self.cache.set_memory(guild_id, cache_key, image)
+                self.log.info(f"Using disk cached base map for guild {guild_id} from {location}")
+                return image.convert('RGB')
             except Exception as e:
                 self.log.warning(f"Error loading cached base map: {e}")
         
@@ -389,10 +480,13 @@ class MapStorage:
             cache_file = cache_dir / f"{cache_key}.png"
             
             try:
-                # Store in memory
-                await self.cache.memory_cache.set(cache_key, image)
+                # Base maps hold a handful of flat colours, so the palette version is
+                # exact at a third of the RGB size; it is also what goes to disk.
+                # Maps with more than 256 colours stay RGB
+                palette_image = await asyncio.to_thread(to_palette, image)
+                await self.cache.set_memory(guild_id, cache_key, palette_image)
                 # Store on disk
-                image.save(cache_file, 'PNG', optimize=True)
+                await run_encode(_write_png, cache_file, palette_image)
                 self.log.info(f"Cached base map for guild {guild_id} in {cache_location}")
             except Exception as e:
                 self.log.warning(f"Error caching base map: {e}")
@@ -409,57 +503,102 @@ class MapStorage:
         region = map_data.get('region', 'world')
         await self.cache.cache_item("final_map", str(guild_id), maps, image_buffer, region=region)
 
+    def _encoded_map_key(self, guild_id: str, maps: Dict, ext: str) -> str:
+        """Content address of a rendered map.
+
+        Region, pin positions and settings fully determine the image; who
+        placed a pin does not, so guilds in the same state (e.g. every empty
+        default map of a region) share one entry.
+        """
+        map_data = maps.get(guild_id, {})
+        positions = sorted((pin['lat'], pin['lng']) for pin in map_data.get('pins', {}).values())
+        return "_".join([
+            "encoded_map",
+            map_data.get('region', 'world'),
+            _digest(positions),
+            self.cache.generate_settings_hash(guild_id, maps),
+        ]) + f".{ext}"
+
+    async def get_encoded_map(self, guild_id: int, maps: Dict, ext: str) -> Optional[bytes]:
+        """Return the encoded map bytes if a map in this exact state was already rendered."""
+        cache_key = self._encoded_map_key(str(guild_id), maps, ext)
+        data = await self.cache.memory_cache.get(cache_key)
+        if data is not None:
+            await self._track_encoded_map(str(guild_id), cache_key)
+        return data
+
+    async def cache_encoded_map(self, guild_id: int, maps: Dict, data: bytes, ext: str):
+        """Keep the encoded map in memory, replacing the guild's previous rendering."""
+        cache_key = self._encoded_map_key(str(guild_id), maps, ext)
+        await self.cache.memory_cache.set(cache_key, data)
+        await self._track_encoded_map(str(guild_id), cache_key)
+
+    async def _track_encoded_map(self, guild_id: str, cache_key: str):
+        previous = self._encoded_map_keys.get(guild_id)
+        self._encoded_map_keys[guild_id] = cache_key
+        if previous and previous != cache_key:
+            await self._release_encoded_map(previous)
+
+    async def _release_encoded_map(self, cache_key: str):
+        # Entries are shared between guilds; keep them while any guild still shows them
+        if cache_key not in self._encoded_map_keys.values():
+            await self.cache.memory_cache.remove(cache_key)
+
     async def invalidate_final_map_cache_only(self, guild_id: int):
         """Invalidate only final map cache, preserve base maps for efficiency - IMPROVED targeting."""
         guild_id_str = str(guild_id)
-        deleted_count = 0
         
-        # Remove from shared cache - target final_map files specifically
-        for cache_file in self.cache_dir.glob("final_map_*.png"):
-            cache_file.unlink()
-            deleted_count += 1
-            self.log.info(f"Removed shared final map cache file: {cache_file.name}")
-        
-        # Remove from guild cache - target final_map files specifically
-        guild_cache_dir = self.data_dir / guild_id_str
-        if guild_cache_dir.exists():
-            for cache_file in guild_cache_dir.glob("final_map_*.png"):
-                cache_file.unlink()
-                deleted_count += 1
-                self.log.info(f"Removed guild final map cache file: {cache_file.name}")
+        async with self.cache.guild_lock(guild_id_str):
+            # Remove from shared cache and guild cache - target final_map files specifically
+            removed = await asyncio.to_thread(_unlink_matching, self.cache_dir, "final_map_*.png")
+            removed += await asyncio.to_thread(_unlink_matching, self.data_dir / guild_id_str, "final_map_*.png")
         
         # Do NOT clear memory cache - preserve base maps
-        self.log.info(f"Invalidated final map cache for guild {guild_id} ({deleted_count} files removed) - preserved base maps")
+        if removed:
+            self.log.info(f"Removed final map cache files: {', '.join(removed)}")
+        self.log.info(f"Invalidated final map cache for guild {guild_id} ({len(removed)} files removed) - preserved base maps")
 
     async def invalidate_base_map_cache_only(self, guild_id: int):
         """Invalidate base map cache when visual settings change - ONLY custom base maps and closeup base maps."""
         guild_id_str = str(guild_id)
-        deleted_count = 0
-        
-        # Only remove CUSTOM base maps from guild cache, preserve shared default cache
         guild_cache_dir = self.data_dir / guild_id_str
-        if guild_cache_dir.exists():
-            for cache_file in guild_cache_dir.glob("base_map_*.png"):
-                cache_file.unlink()
-                deleted_count += 1
-                self.log.info(f"Removed custom base map cache file: {cache_file.name}")
-            
-            # Also remove closeup base maps since they are affected by color changes
-            for cache_file in guild_cache_dir.glob("closeup_base_map_*.png"):
-                cache_file.unlink()
-                deleted_count += 1
-                self.log.info(f"Removed custom closeup base map cache file: {cache_file.name}")
         
-        # Clear memory cache for base maps (affects both custom and default)
-        await self.cache.memory_cache.clear()
-        self.log.info("Cleared base map memory cache")
+        async with self.cache.guild_lock(guild_id_str):
+            # Only remove CUSTOM base maps from guild cache, preserve shared default cache
+            removed = await asyncio.to_thread(_unlink_matching, guild_cache_dir, "base_map_*.png")
+            # Also remove closeup base maps since they are affected by color changes
+            removed += await asyncio.to_thread(_unlink_matching, guild_cache_dir, "closeup_base_map_*.png")
+            # Evict this guild's custom base maps; shared default base maps stay in memory
+            await self.cache.evict_guild_memory(guild_id_str)
         
-        self.log.info(f"Invalidated custom base map cache for guild {guild_id} ({deleted_count} files removed) - PRESERVED shared default base maps")
+        if removed:
+            self.log.info(f"Removed custom base map cache files: {', '.join(removed)}")
+        self.log.info(f"Invalidated custom base map cache for guild {guild_id} ({len(removed)} files removed) - PRESERVED shared default base maps")
     
+    async def drop_guild_cache(self, guild_id: int):
+        """Forget a deleted map's caches: the guild's cache directory and its custom base maps in memory.
+
+        Unlike invalidate_map_cache this leaves the shared cache directory alone.
+        """
+        guild_id_str = str(guild_id)
+        async with self.cache.guild_lock(guild_id_str):
+            await asyncio.to_thread(shutil.rmtree, self.data_dir / guild_id_str, ignore_errors=True)
+            await self.cache.evict_guild_memory(guild_id_str)
+            encoded_key = self._encoded_map_keys.pop(guild_id_str, None)
+            if encoded_key:
+                await self._release_encoded_map(encoded_key)
+        self.cache._guild_locks.pop(guild_id_str, None)
+        self.log.info(f"Dropped map cache for deleted guild map {guild_id}")
+
     # IMPROVED cache invalidation methods
     async def invalidate_map_cache(self, guild_id: int):
         """Invalidate cached maps for a guild - PRESERVES default base maps."""
         await self.cache.invalidate_cache(str(guild_id), ["base_map", "final_map", "closeup", "closeup_base_map"])
+        # Otherwise _generate_map_image hands back the previous bytes, e.g. on a forced
+        # regenerate; dropped even if another guild shares it, which then re-renders too
+        encoded_key = self._encoded_map_keys.pop(str(guild_id), None)
+        if encoded_key:
+            await self.cache.memory_cache.remove(encoded_key)
         
     async def admin_clear_cache(self, guild_id: int):
         """Admin-triggered cache clear - removes CUSTOM base maps only, preserves defaults.""" 
@@ -8,6 +8,13 @@ if TYPE_CHECKING:
 
 
 class LocationModal(discord.ui.Modal, title='Pin Location'):
+    """Modal asking for the location to pin.
+
+    Create one per interaction and do not cache it: discord.py writes the
+    submitted TextInput values onto the instance, so a shared modal would mix
+    up concurrent submissions from different users.
+    """
+
     def __init__(self, cog: 'MapV2Cog', guild_id: int):
         super().__init__()
         self.cog = cog
@@ -71,21 +78,19 @@ class UserPinOptionsView(discord.ui.View):
 
         loading_embed = discord.Embed(
             title="🗺️ Updating Map",
-            description="Removing pin and rendering updated map...",
+            description="Removing your pin...",
             color=0x7289da
         )
         await interaction.edit_original_response(embed=loading_embed, view=None)
 
-        old_location = self.cog.maps[guild_id]['pins'][user_id].get('location', 'Unknown')
-        del self.cog.maps[guild_id]['pins'][user_id]
+        # Single lookup; also safe if the pin went away while the embed was edited
+        pin = self.cog.maps.get(guild_id, {}).get('pins', {}).pop(user_id, None)
+        self.cog._invalidate_pins_cache(int(guild_id))
+        old_location = pin.get('location', 'Unknown') if pin else 'Unknown'
         await self.cog._delete_pin(int(guild_id), int(user_id))
-
-        await self.cog.storage.invalidate_final_map_cache_only(int(guild_id))
         self.cog.log.info(f"Pin removal for guild {guild_id}: preserved base map cache for efficiency")
 
-        channel_id = self.cog.maps[guild_id]['channel_id']
-        await self.cog._update_map(int(guild_id), channel_id)
-        await self.cog._update_global_overview()
+        self.cog._schedule_update(int(guild_id))
 
         embed = discord.Embed(
             title="🗑️ Pin Removed",
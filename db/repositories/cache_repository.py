@@ -1,8 +1,8 @@
 """
-Repository for cache operations (webhooks, feed cache, entry hashes).
+Repository for cache operations (webhooks, feed cache, entry hashes, geocodes).
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
 
 from db.repositories.base import BaseRepository
@@ -142,6 +142,52 @@ class CacheRepository(BaseRepository):
             }
         return result
 
+    # ==========================================
+    # Geocode Cache
+    # ==========================================
+
+    async def ensure_geocode_table(self) -> None:
+        """Create geocode_cache on databases initialised before it joined schema.sql."""
+        await self.execute(
+            """CREATE TABLE IF NOT EXISTS geocode_cache (
+                   query               TEXT PRIMARY KEY,
+                   lat                 DOUBLE PRECISION NOT NULL,
+                   lng                 DOUBLE PRECISION NOT NULL,
+                   display_name        TEXT NOT NULL,
+                   country_code        VARCHAR(8),
+                   created_at          TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+               )"""
+        )
+
+    async def get_geocode(self, query: str) -> Optional[Tuple[float, float, str, Optional[str]]]:
+        """Get a cached geocoder result as (lat, lng, display_name, country_code)."""
+        row = await self.fetchrow(
+            "SELECT lat, lng, display_name, country_code FROM geocode_cache WHERE query = $1",
+            query
+        )
+        return (row['lat'], row['lng'], row['display_name'], row['country_code']) if row else None
+
+    async def set_geocode(
+        self,
+        query: str,
+        lat: float,
+        lng: float,
+        display_name: str,
+        country_code: str = None
+    ) -> None:
+        """Cache a geocoder result for a normalized query."""
+        await self.execute(
+            """INSERT INTO geocode_cache (query, lat, lng, display_name, country_code)
+               VALUES ($1, $2, $3, $4, $5)
+               ON CONFLICT (query) DO UPDATE SET
+                   lat = $2,
+                   lng = $3,
+                   display_name = $4,
+                   country_code = $5,
+                   created_at = NOW()""",
+            query, lat, lng, display_name, country_code
+        )
+
     # ==========================================
     # Entry Hashes (for change detection)
     # ==========================================
@@ -4,11 +4,26 @@ Repository for map operations.
 
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-import json
+import orjson
 
 from db.repositories.base import BaseRepository
 from db.models import MapSettings, MapPin
 
+# Upsert of one pin row; None leaves the stored optional fields untouched
+UPSERT_PIN_QUERY = """INSERT INTO map_pins
+   (guild_id, user_id, latitude, longitude, username, display_name, location, color, avatar_hash, country_code)
+   VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+   ON CONFLICT (guild_id, user_id) DO UPDATE SET
+       latitude = $3,
+       longitude = $4,
+       username = COALESCE($5, map_pins.username),
+       display_name = COALESCE($6, map_pins.display_name),
+       location = COALESCE($7, map_pins.location),
+       color = COALESCE($8, map_pins.color),
+       avatar_hash = COALESCE($9, map_pins.avatar_hash),
+       country_code = COALESCE($10, map_pins.country_code),
+       updated_at = NOW()"""
+
 
 class MapRepository(BaseRepository):
     """Repository for map database operations."""
@@ -44,7 +59,7 @@ class MapRepository(BaseRepository):
         # Handle settings JSON conversion
         if 'settings' in kwargs and kwargs['settings'] is not None:
             if not isinstance(kwargs['settings'], str):
-                kwargs['settings'] = json.dumps(kwargs['settings'])
+                kwargs['settings'] = orjson.dumps(kwargs['settings']).decode()
 
         set_parts = []
         values = []
@@ -70,7 +85,7 @@ class MapRepository(BaseRepository):
 
     async def set_visual_settings(self, guild_id: int, settings: Dict[str, Any]) -> None:
         """Set visual settings (colors, borders, pins)."""
-        settings_json = json.dumps(settings) if not isinstance(settings, str) else settings
+        settings_json = orjson.dumps(settings).decode() if not isinstance(settings, str) else settings
         await self.execute(
             """INSERT INTO map_settings (guild_id, settings)
                VALUES ($1, $2)
@@ -120,20 +135,21 @@ class MapRepository(BaseRepository):
             "SELECT * FROM map_pins WHERE guild_id = $1",
             guild_id
         )
-        result = {}
-        for row in rows:
-            user_id = str(row['user_id'])
-            result[user_id] = {
-                'username': row['username'],
-                'display_name': row['display_name'],
-                'location': row['location'],
-                'lat': row['latitude'],
-                'lng': row['longitude'],
-                'color': row['color'],
-                'avatar_hash': row['avatar_hash'],
-                'timestamp': row['pinned_at'].isoformat() if row['pinned_at'] else None,
-            }
-        return result
+        return {str(row['user_id']): self._pin_from_row(row) for row in rows}
+
+    @staticmethod
+    def _pin_from_row(row) -> Dict[str, Any]:
+        """Build the in-memory pin dict from a map_pins row."""
+        return {
+            'username': row['username'],
+            'display_name': row['display_name'],
+            'location': row['location'],
+            'lat': row['latitude'],
+            'lng': row['longitude'],
+            'color': row['color'],
+            'avatar_hash': row['avatar_hash'],
+            'timestamp': int(row['pinned_at'].timestamp()) if row['pinned_at'] else None,
+        }
 
     async def set_pin(
         self,
@@ -150,20 +166,7 @@ class MapRepository(BaseRepository):
     ) -> MapPin:
         """Set or update a pin for a user."""
         row = await self.fetchrow(
-            """INSERT INTO map_pins
-               (guild_id, user_id, latitude, longitude, username, display_name, location, color, avatar_hash, country_code)
-               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-               ON CONFLICT (guild_id, user_id) DO UPDATE SET
-                   latitude = $3,
-                   longitude = $4,
-                   username = COALESCE($5, map_pins.username),
-                   display_name = COALESCE($6, map_pins.display_name),
-                   location = COALESCE($7, map_pins.location),
-                   color = COALESCE($8, map_pins.color),
-                   avatar_hash = COALESCE($9, map_pins.avatar_hash),
-                   country_code = COALESCE($10, map_pins.country_code),
-                   updated_at = NOW()
-               RETURNING *""",
+            UPSERT_PIN_QUERY + " RETURNING *",
             guild_id, user_id, latitude, longitude, username, display_name, location, color, avatar_hash, country_code
         )
         return MapPin.from_record(row)
@@ -184,6 +187,17 @@ class MapRepository(BaseRepository):
         )
         return result == "DELETE 1"
 
+    async def delete_pins(self, guild_id: int, user_ids: List[int]) -> int:
+        """Delete the pins of several users in one statement."""
+        result = await self.execute(
+            "DELETE FROM map_pins WHERE guild_id = $1 AND user_id = ANY($2::bigint[])",
+            guild_id, user_ids
+        )
+        try:
+            return int(result.split()[-1])
+        except (ValueError, IndexError):
+            return 0
+
     async def delete_all_pins(self, guild_id: int) -> int:
         """Delete all pins for a guild."""
         result = await self.execute(
@@ -215,12 +229,12 @@ class MapRepository(BaseRepository):
         )
         if row:
             value = row['value']
-            return json.loads(value) if isinstance(value, str) else value
+            return orjson.loads(value) if isinstance(value, str) else value
         return None
 
     async def set_global_config(self, key: str, value: Any) -> None:
         """Set a global config value."""
-        value_json = json.dumps(value) if not isinstance(value, str) else value
+        value_json = orjson.dumps(value).decode() if not isinstance(value, str) else value
         await self.execute(
             """INSERT INTO map_global_config (key, value)
                VALUES ($1, $2)
@@ -234,7 +248,7 @@ class MapRepository(BaseRepository):
         result = {}
         for row in rows:
             value = row['value']
-            result[row['key']] = json.loads(value) if isinstance(value, str) else value
+            result[row['key']] = orjson.loads(value) if isinstance(value, str) else value
         return result
 
     # ==========================================
@@ -248,39 +262,82 @@ class MapRepository(BaseRepository):
         # Get all settings
         settings_rows = await self.fetch("SELECT * FROM map_settings")
 
+        # Get every pin in one query instead of one per guild
+        pins_by_guild: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        for row in await self.fetch("SELECT * FROM map_pins"):
+            pins_by_guild.setdefault(row['guild_id'], {})[str(row['user_id'])] = self._pin_from_row(row)
+
         for settings_row in settings_rows:
             guild_id = str(settings_row['guild_id'])
-
-            # Get pins for this guild
-            pins = await self.get_pins_dict(int(guild_id))
-
-            settings = settings_row['settings']
-            if isinstance(settings, str):
-                settings = json.loads(settings)
-            settings = settings or {}
-
-            # Extract meta fields from settings JSON (stored there for flexibility)
-            allow_proximity = settings.pop('allow_proximity', True)
-            created_by = settings.pop('created_by', None)
-            created_at = settings.pop('created_at', None) or (
-                settings_row['created_at'].isoformat() if settings_row['created_at'] else None
-            )
-
-            maps[guild_id] = {
-                'region': settings_row['region'],
-                'channel_id': settings_row['channel_id'],
-                'message_id': settings_row['message_id'],
-                'pins': pins,
-                'settings': settings,  # Visual settings (colors, borders, pins)
-                'allow_proximity': allow_proximity,
-                'created_by': created_by,
-                'created_at': created_at,
-            }
+            pins = pins_by_guild.get(settings_row['guild_id'], {})
+            maps[guild_id] = self._map_data_from_row(settings_row, pins)
 
         return maps
 
-    async def save_map_data(self, guild_id: int, data: Dict[str, Any]) -> None:
-        """Save complete map data (used for migration and general saves)."""
+    @staticmethod
+    def _map_data_from_row(settings_row, pins: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the in-memory map dict from a map_settings row and its pins."""
+        settings = settings_row['settings']
+        if isinstance(settings, str):
+            settings = orjson.loads(settings)
+        settings = settings or {}
+
+        # Extract meta fields from settings JSON (stored there for flexibility)
+        allow_proximity = settings.pop('allow_proximity', True)
+        created_by = settings.pop('created_by', None)
+        created_at = settings.pop('created_at', None)
+        # Older rows kept render bookkeeping in the settings JSON; the columns win
+        legacy_signature = settings.pop('rendered_signature', None)
+        legacy_hash = settings.pop('attachment_hash', None)
+        rendered_signature = settings_row.get('rendered_signature') or legacy_signature
+        attachment_hash = settings_row.get('attachment_hash') or legacy_hash
+        if isinstance(created_at, str):
+            # Maps created before epoch timestamps stored an ISO string
+            try:
+                created_at = int(datetime.fromisoformat(created_at).timestamp())
+            except ValueError:
+                created_at = None
+        if not created_at and settings_row['created_at']:
+            created_at = int(settings_row['created_at'].timestamp())
+
+        return {
+            'region': settings_row['region'],
+            'channel_id': settings_row['channel_id'],
+            'message_id': settings_row['message_id'],
+            'pins': pins,
+            'settings': settings,  # Visual settings (colors, borders, pins)
+            'allow_proximity': allow_proximity,
+            'created_by': created_by,
+            'created_at': created_at,
+            'rendered_signature': rendered_signature,
+            'attachment_hash': attachment_hash,
+        }
+
+    async def ensure_render_columns(self) -> None:
+        """Add the render bookkeeping columns on databases initialised before they joined schema.sql."""
+        await self.execute(
+            """ALTER TABLE map_settings
+                   ADD COLUMN IF NOT EXISTS rendered_signature TEXT,
+                   ADD COLUMN IF NOT EXISTS attachment_hash TEXT"""
+        )
+
+    async def set_render_state(self, guild_id: int, rendered_signature: Optional[str],
+                               attachment_hash: Optional[str]) -> None:
+        """Record what the posted map card shows, leaving the settings payload untouched."""
+        await self.execute(
+            """INSERT INTO map_settings (guild_id, rendered_signature, attachment_hash)
+               VALUES ($1, $2, $3)
+               ON CONFLICT (guild_id) DO UPDATE SET
+                   rendered_signature = $2,
+                   attachment_hash = $3""",
+            guild_id, rendered_signature, attachment_hash
+        )
+
+    async def save_map_data(self, guild_id: int, data: Dict[str, Any], include_pins: bool = True) -> None:
+        """Save complete map data (used for migration and general saves).
+
+        Pass include_pins=False when pins are persisted one by one via set_pin/delete_pin.
+        """
         # Prepare settings JSON - includes visual settings and meta fields
         settings = dict(data.get('settings', {}))  # Copy visual settings
 
@@ -305,21 +362,20 @@ class MapRepository(BaseRepository):
             data.get('region', 'world'),
             data.get('channel_id'),
             data.get('message_id'),
-            json.dumps(settings)
+            orjson.dumps(settings).decode()
         )
 
-        # Save pins (only if there are new pins to save)
+        if not include_pins:
+            return
+
+        # Save pins (only if there are new pins to save), in one batch instead of a round trip per pin
         pins = data.get('pins', {})
-        for user_id_str, pin_data in pins.items():
-            user_id = int(user_id_str)
-            await self.set_pin(
-                guild_id=guild_id,
-                user_id=user_id,
-                latitude=pin_data['lat'],
-                longitude=pin_data['lng'],
-                username=pin_data.get('username'),
-                display_name=pin_data.get('display_name'),
-                location=pin_data.get('location'),
-                color=pin_data.get('color', '#FF0000'),
-                avatar_hash=pin_data.get('avatar_hash')
-            )
+        if pins:
+            await self.executemany(UPSERT_PIN_QUERY, [
+                (
+                    guild_id, int(user_id_str), pin_data['lat'], pin_data['lng'],
+                    pin_data.get('username'), pin_data.get('display_name'), pin_data.get('location'),
+                    pin_data.get('color', '#FF0000'), pin_data.get('avatar_hash'), pin_data.get('country_code'),
+                )
+                for user_id_str, pin_data in pins.items()
+            ])
@@ -114,6 +114,16 @@ CREATE TABLE IF NOT EXISTS webhook_cache (
     created_at          TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Global: Geocoder results for map pins, keyed on the normalized query
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    query               TEXT PRIMARY KEY,
+    lat                 DOUBLE PRECISION NOT NULL,
+    lng                 DOUBLE PRECISION NOT NULL,
+    display_name        TEXT NOT NULL,
+    country_code        VARCHAR(8),
+    created_at          TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- ============================================
 -- CALENDARS
 -- ============================================
@@ -167,6 +177,8 @@ CREATE TABLE IF NOT EXISTS map_settings (
     channel_id          BIGINT,
     message_id          BIGINT,
     settings            JSONB DEFAULT '{}',  -- colors, borders, pins visual settings
+    rendered_signature  TEXT,                -- signature of the state the posted card shows
+    attachment_hash     TEXT,                -- hash of the image attached to the card
     created_at          TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at          TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -278,6 +290,7 @@ COMMENT ON TABLE posted_entries IS 'Tracks posted feed entries to prevent duplic
 COMMENT ON TABLE feed_cache IS 'HTTP caching for feed requests (ETag, Last-Modified)';
 COMMENT ON TABLE entry_hashes IS 'Content hashes for feed entry change detection';
 COMMENT ON TABLE webhook_cache IS 'Cached Discord webhook information per channel';
+COMMENT ON TABLE geocode_cache IS 'Cached Nominatim results for map pin locations';
 COMMENT ON TABLE calendars IS 'iCal calendar configurations';
 COMMENT ON TABLE calendar_events IS 'Tracks Discord events created from calendar entries';
 COMMENT ON TABLE calendar_reminders IS 'Tracks sent calendar reminders';
@@ -22,6 +22,10 @@ import geopandas as gpd
 from dotenv import load_dotenv
 from shapely.geometry import Point
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.map_shapes import DATA_DIR, LAYER_FILES, load_layer
+
 load_dotenv(Path(__file__).parent.parent / ".env")
 
 DB_HOST     = os.getenv("DB_HOST", "localhost")
@@ -30,7 +34,7 @@ DB_NAME     = os.getenv("DB_NAME", "tausendsassa")
 DB_USER     = os.getenv("DB_USER", "tausendsassa")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 
-SHAPEFILE = Path(__file__).parent.parent / "cogs" / "map_data" / "ne_10m_admin_0_countries.shp"
+SHAPEFILE = DATA_DIR / LAYER_FILES["world"]
 
 
 ISO_COLUMN = "ISO_A2_EH"  # ISO_A2 is "-99" for France/Norway/etc. (Natural Earth's
@@ -39,10 +43,11 @@ ISO_COLUMN = "ISO_A2_EH"  # ISO_A2 is "-99" for France/Norway/etc. (Natural Eart
 
 
 def load_countries() -> "gpd.GeoDataFrame":
-    if not SHAPEFILE.exists():
+    # Same loader as the renderer, so the GeoParquet copy is used when present
+    world = load_layer("world")
+    if world is None:
         print(f"ERROR: shapefile not found at {SHAPEFILE}")
         sys.exit(1)
-    world = gpd.read_file(SHAPEFILE)
     if ISO_COLUMN not in world.columns:
         print(f"ERROR: shapefile has no {ISO_COLUMN} column")
         sys.exit(1)
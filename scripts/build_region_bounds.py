@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Precompute shapefile-derived region bounds into cogs/map_data/region_bounds.json.
+core/map_shapes.germany_bounds() reads this sidecar instead of loading the
+admin_0 layer and running a GEOS union + buffer at runtime. Re-run after
+updating the Natural Earth data.
+
+Usage:
+    python scripts/build_region_bounds.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.map_shapes import GERMANY_BUFFER, REGION_BOUNDS_FILE, compute_germany_bounds
+
+
+def main():
+    bounds = {}
+
+    germany = compute_germany_bounds(GERMANY_BUFFER)
+    if germany is None:
+        print("ERROR: could not compute Germany bounds (admin_0 layer missing?)")
+        sys.exit(1)
+    bounds["germany"] = list(germany)
+
+    REGION_BOUNDS_FILE.write_text(json.dumps(bounds, indent=2) + "\n")
+    print(f"Wrote {len(bounds)} region bounds to {REGION_BOUNDS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Pre-render the base map (no pins, default colours and borders) of every
+region into cogs/map_data/base_maps/. MapStorage.get_cached_base_map() checks
+this directory before its runtime cache, so a fresh deployment or an emptied
+cache serves default maps with a PNG decode instead of a full shapefile
+render. Re-run after changing the renderer, the default colours or the
+Natural Earth data, otherwise stale base maps are served.
+
+Usage:
+    python scripts/prerender_base_maps.py
+    python scripts/prerender_base_maps.py germany europe
+    python scripts/prerender_base_maps.py --force
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# core.config validates the bot's environment on import, pulled in via core.map_gen
+load_dotenv(Path(__file__).parent.parent / ".env")
+
+from core.map_gen import MapGenerator, encode_png
+from core.map_shapes import DATA_DIR
+from core.map_storage import BUNDLED_BASE_MAP_DIR, bundled_base_map_name
+
+
+async def main(regions, force: bool):
+    log = logging.getLogger("prerender_base_maps")
+    out_dir = DATA_DIR / BUNDLED_BASE_MAP_DIR
+    out_dir.mkdir(exist_ok=True)
+    generator = MapGenerator(DATA_DIR, out_dir, log)
+
+    regions = regions or list(generator.map_config.MAP_REGIONS)
+    print(f"Rendering {len(regions)} base maps into {out_dir}")
+    for region in regions:
+        width, height = generator.calculate_image_dimensions(region)
+        out = out_dir / bundled_base_map_name(region, width, height)
+        if out.exists() and not force:
+            print(f"  skip {out.name} (exists, use --force to overwrite)")
+            continue
+
+        start = time.perf_counter()
+        image, _ = await generator.render_geopandas_map(region, width, height)
+        if image is None:
+            print(f"  {region}: render failed")
+            continue
+        out.write_bytes(encode_png(image).getvalue())
+        print(f"  {region} -> {out.name} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("regions", nargs="*", help="regions to render (default: all)")
+    parser.add_argument("--force", action="store_true", help="overwrite existing base maps")
+    args = parser.parse_args()
+    asyncio.run(main(args.regions, args.force))
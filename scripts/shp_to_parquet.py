@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Convert the bundled Natural Earth shapefiles (cogs/map_data/*.shp) to
+GeoParquet. core/map_shapes.load_layer() prefers a .parquet sibling over the
+.shp when one exists: WKB geometry plus dictionary-encoded attribute columns
+load several times faster than going through GDAL, which shortens the first
+map render after a restart. Re-run after updating the Natural Earth data.
+
+Usage:
+    python scripts/shp_to_parquet.py
+    python scripts/shp_to_parquet.py --force
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.map_shapes import DATA_DIR, LAYER_FILES
+
+
+def convert(shp: Path, force: bool) -> None:
+    out = shp.with_suffix(".parquet")
+    if out.exists() and not force:
+        print(f"  skip {out.name} (exists, use --force to overwrite)")
+        return
+    frame = gpd.read_file(shp)
+    frame.to_parquet(out, compression="zstd")
+    print(f"  {shp.name} -> {out.name}: {len(frame)} features")
+
+
+def main(force: bool):
+    print(f"Converting Natural Earth layers in {DATA_DIR}")
+    for key, filename in LAYER_FILES.items():
+        shp = DATA_DIR / filename
+        if not shp.exists():
+            print(f"  missing {filename}, skipping {key}")
+            continue
+        convert(shp, force)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="overwrite existing .parquet files")
+    args = parser.parse_args()
+    main(args.force)